@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Check the resource requests of many jobs at once against the
+limits of the partitions. This does the same checks as the
+constraints on dialog.partition, dialog.mem, dialog.cores, and
+dialog.time in rules.py, but on whole columns of answers, so
+that a manifest of tens of thousands of jobs can be screened
+in one pass.
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import math
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+# NumPy is not needed for anything else, so slurmwriter does without
+# this module when it is not installed.
+try:
+    import numpy
+except ImportError as e:
+    numpy = None
+
+###
+# Parts of this project.
+###
+
+from   sloppytree import SloppyTree
+
+fields = ('partition', 'mem', 'cores', 'time')
+
+
+class PartitionLimits:
+    """
+    The limits of each partition, as arrays indexed by the position
+    of the partition's name in self.names.
+    """
+
+    def __init__(self, partitions:SloppyTree, limits:SloppyTree):
+        self.names = tuple(k for k, v in partitions.items() if isinstance(v, dict))
+        self.position = { name : i for i, name in enumerate(self.names) }
+        p = [ partitions[name] for name in self.names ]
+        self.ram = numpy.array([ _.ram - limits.ram.leftover for _ in p ], dtype=float)
+        self.cores = numpy.array([ _.cores - limits.cores.leftover for _ in p ], dtype=float)
+        self.max_hours = numpy.array([ _.max_hours for _ in p ], dtype=float)
+
+
+    def check(self,
+        partition:Sequence[str],
+        mem:Sequence[object],
+        cores:Sequence[object],
+        hours:Sequence[object]) -> Tuple['numpy.ndarray', List[List[str]]]:
+        """
+        Check one column for each of the fields. The values are
+        converted the way the dialog converts them (int, int, float);
+        a value that cannot be converted fails.
+
+        returns -- a boolean array that is True for each job that
+            passes, and the reasons each job fails (empty lists for
+            those that pass).
+        """
+        where = numpy.array([ self.position.get(_, -1) for _ in partition ], dtype=int)
+        mem = as_column(mem, int)
+        cores = as_column(cores, int)
+        hours = as_column(hours, float)
+
+        known = where >= 0
+        i = numpy.where(known, where, 0)
+        with numpy.errstate(invalid='ignore'):
+            mem_ok = known & (1 < mem) & (mem <= self.ram[i])
+            cores_ok = known & (0 < cores) & (cores <= self.cores[i])
+            hours_ok = known & (hours <= self.max_hours[i])
+        mask = mem_ok & cores_ok & hours_ok
+
+        reasons = [ [] for _ in range(len(mask)) ]
+        for row in numpy.flatnonzero(~mask):
+            name = partition[row]
+            if not known[row]:
+                reasons[row].append(f"partition: {name} is not the name of a partition.")
+                continue
+            if not mem_ok[row]:
+                reasons[row].append(f"mem: In {name}, the maximum amount of memory is {self.ram[i[row]]:.0f}")
+            if not cores_ok[row]:
+                reasons[row].append(f"cores: You may ask for a maximum of {self.cores[i[row]]:.0f} cores for jobs in {name}.")
+            if not hours_ok[row]:
+                reasons[row].append(f"time: The maximum run time is {self.max_hours[i[row]]}.")
+
+        return mask, reasons
+
+
+def as_column(values:Sequence[object], datatype:type) -> 'numpy.ndarray':
+    """
+    Convert the values with datatype, as the dialog would; those
+    that will not convert become NaN, which fails every comparison.
+    """
+    column = numpy.full(len(values), numpy.nan)
+    for i, v in enumerate(values):
+        try:
+            column[i] = datatype(v)
+        except (TypeError, ValueError) as e:
+            pass
+    return column
+
+
+def check_records(limits:PartitionLimits,
+    records:Sequence[dict],
+    dialog:SloppyTree) -> Tuple['numpy.ndarray', List[List[str]]]:
+    """
+    Check the partition and resources of a batch of manifest records.
+    Fields a record leaves out take the dialog's defaults.
+    """
+    columns = {}
+    for k in fields:
+        default = dialog[k].default(None)
+        columns[k] = [ default if r.get(k) in (None, "") else str(r[k]).strip() for r in records ]
+    return limits.check(columns['partition'], columns['mem'], columns['cores'], columns['time'])
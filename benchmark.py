@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Measure slurmwriter without a cluster. The benchmark builds a
+scratch directory with a fake sinfo that describes as many partitions
+as you like, a MODULEPATH with as many module files as you like, and
+a manifest of jobs, and then times the parts of slurmwriter that
+depend on them:
+
+    import      starting the interpreter and importing slurmwriter
+    sinfo       parse_sinfo, with and without running (the fake) sinfo
+    modules     all_module_files, with no index, building the per-user
+                index, and reading it back
+    validate    get_answers (from scripted input) and get_record_answers
+    render      the compiled template, and slurmscript
+    usage       reading sacct's output into the usage store, and the
+                lookups behind the defaults
+    write       --manifest from start to finish, in files per second
+
+The results are written as JSON, and --compare prints how they
+differ from the results of an earlier run.
+
+    python benchmark.py --modules 200000 --compare benchmark.a1b2c3d.json
+"""
+
+import typing
+from   typing import *
+
+min_py = (3, 8)
+
+###
+# Standard imports.
+###
+
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+import argparse
+import contextlib
+import getpass
+import io
+import json
+import math
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+###
+# The parts of the scratch directory. rules.py is not imported until
+# the environment points at them, because it reads the environment
+# when it is imported.
+###
+
+def make_cluster(d:str, n_partitions:int) -> None:
+    """
+    A fake sinfo in d/bin that describes n_partitions partitions of
+    four nodes each, and a fake sacctmgr that knows no accounts.
+    """
+    bindir = os.path.join(d, 'bin')
+    os.makedirs(bindir, exist_ok=True)
+
+    with open(os.path.join(d, 'sinfo.txt'), 'w') as f:
+        f.write(f"{'PARTITION':<50} {'CPUS':<10}  {'MEMORY':<10}  {'AVAIL_FEATURES':<25} {'GRES':<10} TIMELIMIT\n")
+        for i in range(n_partitions):
+            name = f"part{i}" + ('*' if i == 0 else '')
+            gres = f"gpu:{i%4+1}" if i % 5 == 4 else "(null)"
+            f.write(f"{name:<50} {52:<10}  {384000*(1+i%4):<10}  {'(null)':<25} {gres:<10} 14-00:00:00\n")
+
+    with open(os.path.join(d, 'nodes.txt'), 'w') as f:
+        for i in range(n_partitions):
+            for j in range(4):
+                idle = (i * 7 + j * 13) % 53
+                f.write(f"node{i}-{j} part{i} {52-idle}/{idle}/0/52 {1000*(idle*1000 % 384000)}\n")
+
+    with open(os.path.join(bindir, 'sinfo'), 'w') as f:
+        f.write(f"""#!/bin/bash
+if [[ "$*" == *-N* ]]; then exec cat "{d}/nodes.txt"; fi
+exec cat "{d}/sinfo.txt"
+""")
+    with open(os.path.join(bindir, 'sacctmgr'), 'w') as f:
+        f.write("#!/bin/bash\nexit 0\n")
+
+    for name in ('sinfo', 'sacctmgr'):
+        os.chmod(os.path.join(bindir, name), 0o755)
+
+
+def make_manifest(d:str, n_records:int, n_partitions:int) -> Tuple[str, str]:
+    """
+    The same n_records jobs, both as a manifest and as the answers
+    a script would give to the dialog. Returns the names of the two.
+    """
+    jobdir = os.path.join(d, 'jobs')
+    os.makedirs(jobdir, exist_ok=True)
+
+    manifest = os.path.join(d, 'jobs.jsonl')
+    answers = os.path.join(d, 'answers.txt')
+    with open(manifest, 'w') as m, open(answers, 'w') as a:
+        for i in range(n_records):
+            record = { "jobname":f"job{i}", "partition":f"part{i % n_partitions}",
+                "mem":4 + i % 60, "cores":1 + i % 32, "time":1 + i % 24,
+                "start":"now", "jobfile":os.path.join(jobdir, f"job{i}.slurm") }
+            m.write(json.dumps(record) + "\n")
+            # jobname, program, inputfile, partition, account, mem,
+            # cores, time, start, jobfile -- a blank line is the default.
+            a.write("\n".join((record['jobname'], "", "", record['partition'], "",
+                str(record['mem']), str(record['cores']), str(record['time']),
+                record['start'], record['jobfile'])) + "\n")
+
+    return manifest, answers
+
+
+def make_sacct(d:str, n_jobs:int) -> str:
+    """
+    What sacct --parsable2 would say about n_jobs finished jobs of
+    the user running the benchmark, spread over twenty programs.
+    Returns the name of the file.
+    """
+    import usage
+
+    user = getpass.getuser()
+    sacct = os.path.join(d, 'sacct.txt')
+    with open(sacct, 'w') as f:
+        f.write("|".join(usage.sacct_fields) + "\n")
+        for i in range(n_jobs):
+            elapsed = f"{i % 24:02d}:{i % 60:02d}:00"
+            end = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(1.6e9 + 600*i))
+            f.write(f"{i}|{user}|slurmwriter prog{i % 20}|{1 + i % 32}|{elapsed}|{elapsed}||{end}|COMPLETED\n")
+            f.write(f"{i}.batch|||{1 + i % 32}|{elapsed}|{elapsed}|{1 + i % 60}G|{end}|COMPLETED\n")
+    return sacct
+
+
+def make_modules(d:str, n_files:int) -> str:
+    """
+    A MODULEPATH of n_files module files, ten versions to a program,
+    with a few files that are not module files mixed in. If the tree
+    is already there with the same number of files, it is reused.
+    """
+    top = os.path.join(d, 'modulefiles')
+    marker = os.path.join(top, '.count')
+    try:
+        with open(marker) as f:
+            if int(f.read()) == n_files: return top
+    except (OSError, ValueError) as e:
+        pass
+
+    shutil.rmtree(top, ignore_errors=True)
+    for i in range(n_files):
+        name = os.path.join(top, f"prog{i//10:06d}")
+        if i % 10 == 0:
+            os.makedirs(name)
+            with open(os.path.join(name, 'README'), 'w') as f:
+                f.write("Not a module file.\n")
+        with open(os.path.join(name, f"{i%10}.{i%7}"), 'w') as f:
+            f.write(f"#%Module1.0\nprepend-path PATH /opt/prog{i//10}/{i%10}/bin\n")
+
+    with open(marker, 'w') as f:
+        f.write(str(n_files))
+    return top
+
+
+###
+# Timing.
+###
+
+def measure(f:Callable[[], int], repeat:int, unit:str) -> dict:
+    """
+    Run f repeat times. f returns how many things it did each time.
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = f()
+        times.append(time.perf_counter() - t0)
+
+    best = min(times)
+    return {"count":count, "unit":unit, "best":best, "median":statistics.median(times),
+        "per_second":count/best if best else None}
+
+
+def bench_import(repeat:int) -> dict:
+    """
+    The time to import slurmwriter in a new interpreter, less the
+    time to start an interpreter that does nothing.
+    """
+    def run(code:str) -> float:
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=here, check=True,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - t0
+
+    empty = min(run('pass') for _ in range(repeat))
+    result = measure(lambda : run('import slurmwriter') and 1, repeat, "imports")
+    result['interpreter'] = empty
+    result['import'] = result['best'] - empty
+    return result
+
+
+def bench_modules(d:str, repeat:int) -> dict:
+    import rules
+    import utils
+
+    count = lambda it : sum(1 for _ in it)
+    index = os.path.join(d, 'cache', 'modules.bench.json')
+
+    def build() -> int:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(index)
+        return count(utils.all_module_files(index))
+
+    def lookup() -> int:
+        # The software index comes from the cache after the first time,
+        # but the trie of module names is built each time.
+        rules.find_software.cache_clear()
+        rules.module_trie.cache_clear()
+        return sum(rules.is_installed(_) for _ in rules.find_software().modules)
+
+    return {
+        "scan" : measure(lambda : count(utils.all_module_files()), repeat, "files"),
+        "build_index" : measure(build, repeat, "files"),
+        "with_index" : measure(lambda : count(utils.all_module_files(index)), repeat, "files"),
+        "software" : measure(lookup, repeat, "programs") }
+
+
+def bench_render(manifest:str, repeat:int) -> dict:
+    import script
+    import slurmwriter
+    import utils
+    from   rules import dialog
+
+    jobs = [ slurmwriter.get_record_answers(dialog, record)[0] 
+        for n, record, error in utils.read_manifest(manifest) ]
+    template = script.templates['site']
+    def render(f:Callable) -> int:
+        for job in jobs: f(job)
+        return len(jobs)
+
+    return {
+        "template" : measure(lambda : render(template.render), repeat, "scripts"),
+        "slurmscript" : measure(lambda : render(script.slurmscript), repeat, "scripts") }
+
+
+def bench_sinfo(repeat:int) -> dict:
+    import rules
+    import utils
+
+    text = utils.dorunrun(f"{rules.params.querytool.exe()} {rules.params.querytool.opts}",
+        return_datatype=str)
+    return {
+        "with_sinfo" : measure(lambda : len(utils.parse_sinfo(rules.params)) - 1, repeat, "partitions"),
+        "parse_only" : measure(lambda : len(utils.parse_sinfo(rules.params, text)) - 1, repeat, "partitions") }
+
+
+def bench_usage(d:str, sacct:str, repeat:int) -> dict:
+    import usage
+
+    with open(sacct) as f:
+        text = f.read()
+    filename = os.path.join(d, 'cache', 'usage.bench.db')
+    user = getpass.getuser()
+
+    def ingest() -> int:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(filename)
+        store = usage.open_store(filename)
+        n = store.ingest(usage.parse_sacct(text))
+        store.close()
+        return n
+
+    def lookup() -> int:
+        store = usage.open_store(filename)
+        n = sum(len(store.usual(user, f"prog{i % 25}")) for i in range(1000))
+        store.close()
+        return n
+
+    return {
+        "ingest" : measure(ingest, repeat, "jobs"),
+        "lookup" : measure(lookup, repeat, "defaults") }
+
+
+def bench_validate(manifest:str, answers:str, repeat:int) -> dict:
+    import slurmwriter
+    import utils
+    from   rules import dialog
+
+    records = [ record for n, record, error in utils.read_manifest(manifest) ]
+    with open(answers) as f:
+        text = f.read()
+    myargs = argparse.Namespace(debug=False)
+
+    def scripted() -> int:
+        slurmwriter.INTERACTIVE = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            stdin, sys.stdin = sys.stdin, io.StringIO(text)
+            try:
+                for _ in records:
+                    slurmwriter.get_answers(dialog, myargs)
+            finally:
+                sys.stdin = stdin
+        return len(records)
+
+    def from_script() -> int:
+        with open(answers, 'rb') as f:
+            for n, record, lines, error in slurmwriter.read_script(dialog, f):
+                job, errors = (None, [error]) if error else slurmwriter.get_record_answers(dialog, record, lines)
+                if errors: raise ValueError(f"line {n}: {errors}")
+        return len(records)
+
+    def from_manifest() -> int:
+        for record in records:
+            job, errors = slurmwriter.get_record_answers(dialog, record)
+            if errors: raise ValueError(f"{record}: {errors}")
+        return len(records)
+
+    return {
+        "get_answers" : measure(scripted, repeat, "jobs"),
+        "read_script" : measure(from_script, repeat, "jobs"),
+        "get_record_answers" : measure(from_manifest, repeat, "jobs") }
+
+
+def bench_write(manifest:str, jobs:int, repeat:int) -> dict:
+    import slurmwriter
+
+    myargs = argparse.Namespace(manifest=manifest, report=f"{manifest}.report", jobs=jobs,
+        refresh_cluster=False, submit=False, jobids="", debug=False, force=True)
+    def write() -> int:
+        with contextlib.redirect_stderr(io.StringIO()):
+            code = slurmwriter.manifest_main(myargs)
+        if code != os.EX_OK: raise RuntimeError(f"manifest_main returned {code}; see {myargs.report}")
+        with open(myargs.report) as f:
+            return sum(1 for _ in f)
+
+    return measure(write, repeat, "files")
+
+
+def compare(old:dict, new:dict, path:str="") -> None:
+    """
+    Print the ratio of the new rate to the old one for each measurement
+    the two runs have in common. Above 1 is faster.
+    """
+    for k, v in new.items():
+        if not isinstance(v, dict) or k not in old: continue
+        if 'best' in v:
+            print(f"{path+k:>40} : {old[k]['best']/v['best']:6.2f}x  "
+                f"({old[k]['best']*1000:.1f} ms -> {v['best']*1000:.1f} ms)")
+        else:
+            compare(old[k], v, f"{path}{k}.")
+
+
+def benchmark_main(myargs:argparse.Namespace) -> int:
+    d = myargs.workdir or tempfile.mkdtemp(prefix='swbench.')
+    os.makedirs(d, exist_ok=True)
+
+    make_cluster(d, myargs.partitions)
+    modulepath = make_modules(d, myargs.modules)
+    manifest, answers = make_manifest(d, myargs.records, myargs.partitions)
+
+    os.environ['PATH'] = os.path.join(d, 'bin') + os.pathsep + os.environ['PATH']
+    os.environ['MODULEPATH'] = modulepath
+    os.environ['SLURMWRITER_CACHE'] = os.path.join(d, 'cache')
+    os.environ['SLURMWRITER_INDEX'] = os.path.join(d, 'no.such.index')
+    os.environ['SLURMWRITER_USAGE'] = os.path.join(d, 'cache', 'usage.db')
+    sys.path.insert(0, here)
+
+    results = {}
+    try:
+        results['import'] = bench_import(myargs.repeat)
+        results['sinfo'] = bench_sinfo(myargs.repeat)
+        results['modules'] = bench_modules(d, myargs.repeat)
+        results['validate'] = bench_validate(manifest, answers, myargs.repeat)
+        results['render'] = bench_render(manifest, myargs.repeat)
+        results['usage'] = bench_usage(d, make_sacct(d, myargs.records), myargs.repeat)
+        # Last, because --manifest fixes the creation time in the dialog.
+        results['write'] = bench_write(manifest, myargs.jobs, myargs.repeat)
+
+    finally:
+        if not myargs.workdir: shutil.rmtree(d, ignore_errors=True)
+
+    import utils
+    commit = utils.dorunrun(['git', '-C', here, 'rev-parse', '--short', 'HEAD'],
+        return_datatype=str).strip()
+    output = myargs.output or f"benchmark.{commit or 'uncommitted'}.json"
+    with open(output, 'w') as f:
+        json.dump({"commit":commit, "when":time.strftime('%Y-%m-%d %H:%M:%S'),
+            "python":platform.python_version(), "host":platform.node(),
+            "sizes":{"partitions":myargs.partitions, "modules":myargs.modules,
+                "records":myargs.records, "jobs":myargs.jobs},
+            "results":results}, f, indent=2)
+    print(f"Results are in {output}")
+
+    if myargs.compare:
+        with open(myargs.compare) as f:
+            old = json.load(f)
+        print(f"Compared with {old.get('commit')} of {old.get('when')}:")
+        compare(old['results'], results)
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="benchmark",
+        description="Time slurmwriter against a synthetic cluster.")
+
+    parser.add_argument('--compare', type=str, default="",
+        help="The results of an earlier run to compare with.")
+    parser.add_argument('--jobs', type=int, default=1,
+        help="Processes to use for the --manifest measurement.")
+    parser.add_argument('--modules', type=int, default=10000,
+        help="Number of module files in the MODULEPATH.")
+    parser.add_argument('-o', '--output', type=str, default="",
+        help="Where to write the results. The default is benchmark.<commit>.json")
+    parser.add_argument('--partitions', type=int, default=20,
+        help="Number of partitions the fake sinfo describes.")
+    parser.add_argument('--records', type=int, default=2000,
+        help="Number of jobs to validate, render, and write.")
+    parser.add_argument('--repeat', type=int, default=3,
+        help="Number of times to run each measurement. The best time is reported.")
+    parser.add_argument('--workdir', type=str, default="",
+        help="Keep the synthetic cluster here, and reuse it next time.")
+
+    myargs = parser.parse_args()
+    sys.exit(benchmark_main(myargs))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+The cluster index is a compact, read-only file with the names,
+versions, and locations of the module files, and the table of
+partitions. It is built by an administrator (usually from cron):
+
+    python clusterindex.py --build [--output /path/to/cluster.idx]
+
+and every user's slurmwriter maps it into memory rather than
+discovering the same information over again.
+
+Layout of the file (all integers are little-endian):
+
+    header      MAGIC, format version, time built, counts, and a
+                CRC32 of everything that follows the header.
+    modules     fixed size records, sorted by (name, version).
+    partitions  fixed size records, sorted by name.
+    strings     UTF-8 text referred to by (offset, length) in the
+                records above.
+"""
+
+import typing
+from   typing import *
+
+min_py = (3, 8)
+
+###
+# Standard imports.
+###
+
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+import argparse
+import math
+import mmap
+import struct
+import tempfile
+import time
+import zlib
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# Parts of this project.
+###
+
+from   sloppytree import SloppyTree
+import utils
+
+MAGIC = b"SWIDX\0"
+FORMAT_VERSION = 1
+
+# magic, format version, time built, number of modules, number of
+# partitions, offset of the strings, length of the strings, CRC32.
+header = struct.Struct("<6sHdIIIII")
+
+# name, version, path -- each an (offset, length) into the strings.
+module_record = struct.Struct("<IHIHIH")
+
+# name, xtras, gpus as (offset, length); cores, ram in GB, max_hours,
+# and 1 if this is the default partition.
+partition_record = struct.Struct("<IHIHIHIIdB")
+
+
+class ClusterIndex:
+    """
+    A read-only view of an index file. Lookups search the records
+    where they lie in the mapped file; strings are decoded only for
+    the records that are found.
+    """
+
+    def __init__(self, filename:str):
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+
+        if len(self.buffer) < header.size:
+            raise ValueError(f"{filename} is too short to be an index.")
+
+        ( magic, version, self.built, self.n_modules, self.n_partitions,
+            self.strings_at, strings_len, crc ) = header.unpack_from(self.buffer)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{filename} is not a version {FORMAT_VERSION} index.")
+        if zlib.crc32(self.buffer[header.size:]) != crc:
+            raise ValueError(f"{filename} fails its checksum.")
+
+        self.modules_at = header.size
+        self.partitions_at = self.modules_at + self.n_modules * module_record.size
+
+
+    def age(self) -> float:
+        """
+        Seconds since the index was built.
+        """
+        return time.time() - self.built
+
+
+    def close(self) -> None:
+        self.buffer.release()
+        self.map.close()
+
+
+    def module(self, i:int) -> Tuple[str, str, str]:
+        """
+        The (name, version, path) of the i'th module.
+        """
+        n, n_len, v, v_len, p, p_len = module_record.unpack_from(
+            self.buffer, self.modules_at + i * module_record.size)
+        return self.string(n, n_len), self.string(v, v_len), self.string(p, p_len)
+
+
+    def modules(self) -> Tuple[str, str, str]:
+        """
+        A generator of (name, version, path) for all the modules.
+        """
+        for i in range(self.n_modules):
+            yield self.module(i)
+
+
+    def partitions(self) -> SloppyTree:
+        """
+        The partitions, in the same shape as utils.parse_sinfo builds them.
+        """
+        tree = SloppyTree()
+        for i in range(self.n_partitions):
+            ( n, n_len, x, x_len, g, g_len,
+                cores, ram, max_hours, default ) = partition_record.unpack_from(
+                self.buffer, self.partitions_at + i * partition_record.size)
+            name = self.string(n, n_len)
+            tree[name].cores = cores
+            tree[name].ram = ram
+            tree[name].xtras = self.string(x, x_len) if x_len else None
+            tree[name].gpus = self.string(g, g_len) if g_len else None
+            tree[name].max_hours = max_hours
+            if default: tree.default_partition = name
+        return tree
+
+
+    def raw_string(self, offset:int, length:int) -> memoryview:
+        """
+        The bytes of a string, still in the mapped file.
+        """
+        start = self.strings_at + offset
+        return self.buffer[start:start+length]
+
+
+    def string(self, offset:int, length:int) -> str:
+        return str(self.raw_string(offset, length), 'utf-8')
+
+
+def build_index(filename:str,
+    modules:Iterable[Tuple[str, str, str]],
+    partitions:SloppyTree) -> int:
+    """
+    Write an index file. It is written beside its final location
+    and renamed into place, so the users who have the old one mapped
+    are not disturbed. Returns the number of modules written.
+    """
+    strings = bytearray()
+    offsets = {}
+    def intern(s:str) -> Tuple[int, int]:
+        b = s.encode('utf-8')
+        if b not in offsets:
+            offsets[b] = len(strings)
+            strings.extend(b)
+        return offsets[b], len(b)
+
+    body = bytearray()
+    modules = sorted(set(modules), key=lambda m : (m[0].encode('utf-8'), m[1], m[2]))
+    for name, version, path in modules:
+        body.extend(module_record.pack(*intern(name), *intern(version), *intern(path)))
+
+    names = sorted(k for k in partitions.keys() if k != 'default_partition')
+    for name in names:
+        p = partitions[name]
+        body.extend(partition_record.pack(*intern(name),
+            *intern(p.xtras or ""), *intern(p.gpus or ""),
+            p.cores, p.ram, p.max_hours,
+            name == partitions.get('default_partition')))
+
+    strings_at = header.size + len(body)
+    body.extend(strings)
+    head = header.pack(MAGIC, FORMAT_VERSION, time.time(),
+        len(modules), len(names), strings_at, len(strings), zlib.crc32(body))
+
+    fd, tempname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(head)
+            f.write(body)
+        os.chmod(tempname, 0o644)
+        os.replace(tempname, filename)
+    except:
+        os.unlink(tempname)
+        raise
+
+    return len(modules)
+
+
+def open_index(filename:str, ttl:float) -> ClusterIndex:
+    """
+    Map the index if it exists, is sound, and is younger than ttl
+    seconds. Otherwise, return None and let the caller find the
+    information some other way.
+    """
+    try:
+        index = ClusterIndex(filename)
+    except (OSError, ValueError) as e:
+        return None
+
+    if index.age() > ttl:
+        index.close()
+        return None
+    return index
+
+
+def live_modules() -> Tuple[str, str, str]:
+    """
+    A generator of (name, version, path) for the module files
+    in the MODULEPATH.
+    """
+    for location in ( _ for _ in os.getenv('MODULEPATH', "").split(':') if _ ):
+        location = utils.expandall(location)
+        for path in utils.all_files_of_type(location, 'mod'):
+            yield (*utils.module_name_version(location, path), path)
+
+
+def clusterindex_main(myargs:argparse.Namespace) -> int:
+    import rules
+
+    if myargs.build:
+        n = build_index(myargs.output, live_modules(), utils.parse_sinfo(rules.params))
+        myargs.verbose and print(f"Wrote {n} modules to {myargs.output}")
+        return os.EX_OK
+
+    index = open_index(myargs.output, math.inf)
+    if index is None:
+        print(f"{myargs.output} is missing, or is not a usable index.")
+        return os.EX_DATAERR
+
+    print(f"Built {time.ctime(index.built)}, {index.n_modules} modules.")
+    for name, p in index.partitions().items():
+        print(f"    {name} : {p}")
+    for name, version, path in index.modules():
+        print(f"    {name}/{version} -> {path}")
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+    import rules
+
+    parser = argparse.ArgumentParser(prog="clusterindex",
+        description="Build or show the index of modules and partitions shared by slurmwriter users.")
+
+    parser.add_argument('--build', action='store_true',
+        help="Build the index. Without this option, print the current one.")
+    parser.add_argument('-o', '--output', type=str, default=rules.params.sharedindex.file,
+        help="Name of the index file.")
+    parser.add_argument('-v', '--verbose', action='store_true')
+
+    myargs = parser.parse_args()
+    sys.exit(clusterindex_main(myargs))
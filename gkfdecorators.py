@@ -19,9 +19,12 @@ import bdb
 import contextlib
 import datetime
 from   functools import wraps
-import inspect
+import gzip
+import linecache
 import os
+import reprlib
 import sys
+import traceback
 import types
 
 # Credits
@@ -60,15 +63,108 @@ def show_exceptions(func:object) -> object:
 
 
 
+###
+# What goes into a dump, and where. Each can be set in the environment.
+#   TRAP_DUMP_DIR -- the directory for dumps. By default, a directory
+#       named for today's date in the current directory.
+#   TRAP_DUMP_GZIP -- if set to anything but 0, the dumps are compressed.
+#   TRAP_MAX_REPR -- the most characters written for any one value.
+#   TRAP_MAX_DEPTH -- how deep into nested trees and lists we look.
+#   TRAP_MAX_ITEMS -- how many members of a tree or list are shown.
+###
+def env_limit(name:str, default:int) -> int:
+    """
+    A positive whole number from the environment, or the default if
+    it is not set, or is something else. A typo here must not keep
+    every program that imports this file from starting.
+    """
+    try:
+        value = int(os.getenv(name, default))
+    except ValueError as e:
+        return default
+    return value if value > 0 else default
+
+
+dump_dir = os.getenv('TRAP_DUMP_DIR', "")
+dump_gzip = os.getenv('TRAP_DUMP_GZIP', "0") not in ("", "0")
+max_repr = env_limit('TRAP_MAX_REPR', 1000)
+max_depth = env_limit('TRAP_MAX_DEPTH', 3)
+max_items = env_limit('TRAP_MAX_ITEMS', 20)
+
+
+class DumpRepr(reprlib.Repr):
+    """
+    A reprlib.Repr that also limits subclasses of dict, list, tuple,
+    and set (SloppyTree, for one), rather than calling their own
+    __repr__ and cutting the result short after building all of it.
+    """
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = max_depth
+        self.maxdict = self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = max_items
+        self.maxstring = self.maxother = self.maxlong = max_repr
+
+    def repr1(self, x:object, level:int) -> str:
+        for t in (dict, list, tuple, set, frozenset):
+            if isinstance(x, t) and type(x) is not t:
+                text = getattr(self, f"repr_{t.__name__}")(x, level)
+                return f"{type(x).__name__}({text})"
+        text = super().repr1(x, level)
+        return text if len(text) <= max_repr else text[:max_repr-3] + '...'
+
+
+def write_dump(skip:types.CodeType) -> str:
+    """
+    Write the exception being handled, and the local variables of
+    each frame, to a dump file. Frames running the code skip (the
+    decorator's wrapper) are left out. Returns the name of the file.
+    """
+    e_type, e_val, e_trace = sys.exc_info()
+
+    # The file will be under TRAP_DUMP_DIR, or under a directory with
+    # today's ISO date string as its name.
+    new_dir = dump_dir or os.path.join(os.getcwd(), datetime.datetime.today().isoformat()[:10])
+    os.makedirs(new_dir, exist_ok=True)
+
+    # The file name will be the pid; a second failure is appended to it.
+    candidate_name = os.path.join(new_dir, f"pid{os.getpid()}") + ('.gz' if dump_gzip else '')
+    sys.stderr.write("writing dump to file {}".format(candidate_name))
+
+    limited = DumpRepr()
+    with (gzip.open(candidate_name, 'at') if dump_gzip else open(candidate_name, 'a')) as f:
+        with contextlib.redirect_stdout(f):
+            print('Exception raised {}: "{}"'.format(e_type, e_val))
+
+            for frame, lineno in traceback.walk_tb(e_trace):
+                if frame.f_code is skip: continue
+
+                # log the frame information
+                code = frame.f_code
+                print('\n**File <{}>, line {}, in function {}()\n    {}'.format(
+                    code.co_filename, lineno, code.co_name,
+                    linecache.getline(code.co_filename, lineno).lstrip()
+                    ))
+
+                # log every local variable of the frame, within limits.
+                for k, v in frame.f_locals.items():
+                    try:
+                        print('    {} = {}'.format(k, limited.repr(v)))
+                    except:
+                        pass
+
+            print('\n')
+
+    return candidate_name
+
+
 def trap(func:object) -> None:
     """
-    An amplified version of the show_exceptions decorator.
+    An amplified version of the show_exceptions decorator. Nothing
+    is done unless func raises an exception.
     """
 
     @wraps(func)
     def wrapper(*args, **kwds):
-        __wrapper_marker_local__ = None
-    
         try:
             return func(*args, **kwds)
 
@@ -82,55 +178,12 @@ def trap(func:object) -> None:
                 sys.exit(os.EX_OK)
 
             print("{}".format(e))
-            # Who am I?
-            pid = 'pid{}'.format(os.getpid())
-
-            # First order of business: create a dump file. The file will be under
-            # $CANOE_LOG with today's ISO date string as the dir name.
-            new_dir = os.path.join(os.getcwd(), datetime.datetime.today().isoformat()[:10])
-            os.makedirs(new_dir, exist_ok=True)
-
-            # The file name will be the pid (possibly plus something like "A" if this
-            # is the second time today this pid has failed).
-            candidate_name = os.path.join(new_dir, pid)
-            
-            sys.stderr.write("writing dump to file {}".format(candidate_name))
-
-            with open(candidate_name, 'a') as f:
-                with contextlib.redirect_stdout(f):
-                    # Protect against further failure -- log the exception.
-                    try:
-                        e_type, e_val, e_trace = sys.exc_info()
-                    except Exception as e:
-                        sys.stderr.write(str(e))
-
-                    print('Exception raised {}: "{}"'.format(e_type, e_val))
-                    
-                    # iterate through the frames in reverse order so we print the
-                    # most recent frame first
-                    for frame_info in inspect.getinnerframes(e_trace):
-                        f_locals = frame_info[0].f_locals
-                
-                        # if there's a local variable named __wrapper_marker_local__, we assume
-                        # the frame is from a call of this function, 'wrapper', and we skip
-                        # it. The problem happened before the dumping function was called.
-                        if '__wrapper_marker_local__' in f_locals: continue
-
-                        # log the frame information
-                        print('\n**File <{}>, line {}, in function {}()\n    {}'.format(
-                            frame_info[1], frame_info[2], frame_info[3], frame_info[4][0].lstrip()
-                            ))
-
-                        # log every local variable of the frame
-                        for k, v in f_locals.items():
-                            try:
-                                print('    {} = {}'.format(k, v))
-                            except:
-                                pass
-
-                    print('\n')
+            try:
+                write_dump(wrapper.__code__)
+            except Exception as e:
+                # Protect against further failure.
+                sys.stderr.write(str(e))
 
         sys.exit(os.EX_DATAERR)
 
     return wrapper
-
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+A JobSpec is the answers for one job, after they have been checked.
+The dialog in rules.py says what to ask and how to check it; the
+answers go into a draft that belongs to one job, and the draft is
+frozen into a JobSpec. Nothing about one job is left behind in the
+dialog for the next one to find.
+
+A JobSpec cannot be changed. To make one that is a little different,
+
+    array_job = spec.replace(array_size=100, array_range="0-99%50")
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import math
+import types
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# The answers to the questions in rules.dialog, what the dialog's
+# hooks add (modules, joblines, comment), when the job was written, and the
+# shape of a job array. Answers to any other questions a site adds
+# to the dialog are kept in extras, and read the same way.
+###
+FIELDS = ('username', 'jobname', 'program', 'inputfile', 'partition', 'account',
+    'mem', 'cores', 'time', 'start', 'jobfile',
+    'modules', 'joblines', 'comment', 'written',
+    'array_size', 'array_range', 'array_table', 'array_variables')
+
+NO_EXTRAS = types.MappingProxyType({})
+
+
+class JobSpec:
+    """
+    The checked answers for one job, as attributes. Fields that
+    were not answered are None.
+    """
+    __slots__ = FIELDS + ('extras',)
+
+    def __init__(self, **answers):
+        for k in FIELDS:
+            object.__setattr__(self, k, answers.pop(k, None))
+        object.__setattr__(self, 'extras', types.MappingProxyType(answers) if answers else NO_EXTRAS)
+
+
+    def __eq__(self, other:object) -> bool:
+        return type(other) is JobSpec and self.as_dict() == other.as_dict()
+
+
+    def __getattr__(self, name:str) -> object:
+        # Only called for names that are not among the slots.
+        try:
+            return self.extras[name]
+        except KeyError as e:
+            raise AttributeError(f"A JobSpec has no {name}") from None
+
+
+    def __reduce__(self) -> tuple:
+        return (JobSpec.from_dict, (self.as_dict(),))
+
+
+    def __repr__(self) -> str:
+        return f"JobSpec({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+    def __setattr__(self, name:str, value:object) -> None:
+        raise AttributeError("A JobSpec cannot be changed. Use replace().")
+
+
+    def __delattr__(self, name:str) -> None:
+        raise AttributeError("A JobSpec cannot be changed. Use replace().")
+
+
+    def as_dict(self) -> dict:
+        """
+        The fields that have values, and the extras.
+        """
+        d = { k : getattr(self, k) for k in FIELDS if getattr(self, k) is not None }
+        d.update(self.extras)
+        return d
+
+
+    @classmethod
+    def from_dict(cls, d:dict) -> 'JobSpec':
+        return cls(**d)
+
+
+    def replace(self, **changes) -> 'JobSpec':
+        """
+        A new JobSpec, with changes.
+        """
+        return JobSpec(**{**self.as_dict(), **changes})
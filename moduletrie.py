@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Resolve what a user says they want to run to exactly one module
+file. The names of the modules are kept in a prefix trie, so an
+answer is resolved by walking it a character at a time, and an
+answer that could mean several modules can say which ones.
+
+    samtools        -> samtools/1.10    (the default, or the latest)
+    samtools/1.9    -> samtools/1.9
+    gatk-4.2.0.0    -> gatk/4.2.0.0
+    sam             -> samtools/1.10    (if nothing else starts with sam)
+    samtools/1      -> samtools/1.9, samtools/1.10
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import math
+import re
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# What people put between the name of a program and its version.
+# A node of the trie that ends a module's name has the name under
+# the key END, which no character can be.
+###
+separators = frozenset('/-')
+END = ''
+numbers = re.compile(r'(\d+)')
+
+
+class ModuleTrie:
+    """
+    A trie of the module names. Each node is a dict of the next
+    characters; the versions are looked up by name, once the name
+    has been found.
+    """
+
+    def __init__(self, modules:Dict[str, List[str]], defaults:Dict[str, str]=None):
+        """
+        modules -- name -> the versions of it there are module files for.
+        defaults -- name -> the version the site has made the default.
+        """
+        self.versions = modules
+        self.defaults = defaults or {}
+        self.chosen = {}
+        self.root = {}
+        for name in modules:
+            node = self.root
+            for c in name:
+                node = node.setdefault(c, {})
+            node[END] = name
+
+
+    def candidates(self, prefix:str, n:int=20) -> List[str]:
+        """
+        Up to n names of modules that start with prefix.
+        """
+        node = self.root
+        for c in prefix:
+            node = node.get(c)
+            if node is None: return []
+        return sorted(self.names_under(node, n))
+
+
+    def default_version(self, name:str) -> str:
+        """
+        The version the site made the default, or the latest one.
+        A module file with no version has the version "". What is
+        chosen is kept in self.chosen.
+        """
+        if name not in self.chosen:
+            versions = self.versions.get(name) or ('',)
+            default = self.defaults.get(name)
+            self.chosen[name] = default if default in versions else max(versions, key=version_key)
+        return self.chosen[name]
+
+
+    def names_under(self, node:dict, n:int) -> List[str]:
+        """
+        Up to n names of modules at or below node.
+        """
+        names, pending = [], [node]
+        while pending and len(names) < n:
+            node = pending.pop()
+            for c, child in node.items():
+                if c == END: names.append(child)
+                else: pending.append(child)
+        return names[:n]
+
+
+    def resolve(self, answer:str, complete:bool=True, n:int=20) -> Tuple[Tuple[str, str]]:
+        """
+        The (name, version) of each module that answer could mean, in
+        time proportional to the length of answer unless there is more
+        than one. Exactly one means the answer is resolved; none means
+        there is no such module.
+
+        complete -- if True, an answer that is the start of only one
+            name means that name.
+        """
+        node = self.root
+        named = None
+        for i, c in enumerate(answer):
+            # Remember the longest name that is followed by what
+            # could be a version, in case the rest is not a name.
+            if END in node and c in separators:
+                named = node[END], answer[i+1:]
+            node = node.get(c)
+            if node is None: break
+
+        else:
+            if END in node:
+                return ((node[END], self.default_version(node[END])),)
+            names = sorted(self.names_under(node, n)) if complete and answer else []
+            return tuple((name, self.default_version(name)) for name in names)
+
+        if named is None: return ()
+
+        name, version = named
+        versions = self.versions.get(name, ())
+        if version in versions: return ((name, version),)
+        return tuple((name, _) for _ in sorted(versions, key=version_key)
+            if version and _.startswith(version))[:n]
+
+
+def version_key(version:str) -> tuple:
+    """
+    Sort versions the way people read them, so that 1.10 comes
+    after 1.9.
+    """
+    return tuple((0, int(_), '') if _.isdigit() else (1, 0, _)
+        for _ in numbers.split(version) if _)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Recommend partitions for a job. The partitions where the job fits
+are ranked by how much of them is idle right now, so that jobs
+go where they will start soonest, rather than all piling onto
+the default partition.
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import bisect
+import math
+import time
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# Parts of this project.
+###
+
+from   sloppytree import SloppyTree
+
+
+class Recommender:
+    """
+    An index of the partitions, built once from the limits and
+    the state of the nodes. The partitions are kept in order of
+    how much memory a job may ask for, and each one carries its
+    rank by idle cores (then free memory, and partitions with GPUs
+    last), so a lookup bisects past the partitions that are too
+    small and sorts what is left.
+    """
+
+    def __init__(self, 
+        partitions:SloppyTree, 
+        limits:SloppyTree, 
+        state:SloppyTree,
+        names:Iterable[str]=None):
+        """
+        partitions -- as built by utils.parse_sinfo.
+        limits -- the leftover cores and memory from rules.py.
+        state -- as built by utils.parse_node_state.
+        names -- the partitions that may be recommended; all of
+            them if not given.
+        """
+        self.built = time.time()
+        self.found = {}
+        self.has_state = bool(state)
+        names = [ _ for _ in (names if names is not None else partitions.keys()) 
+            if isinstance(partitions.get(_), dict) ]
+
+        # Partitions with GPUs are kept for the jobs that need them.
+        ranked = sorted(names, 
+            key=lambda _ : (not partitions[_].gpus, 
+                state[_].get('idle_cores', 0), state[_].get('free_ram', 0)),
+            reverse=True)
+        rank = { name : i for i, name in enumerate(ranked) }
+
+        entries = sorted(
+            (partitions[_].ram - limits.ram.leftover,
+             partitions[_].cores - limits.cores.leftover,
+             partitions[_].max_hours,
+             rank[_], _) for _ in names )
+        self.ram = [ _[0] for _ in entries ]
+        self.entries = entries
+
+
+    def age(self) -> float:
+        return time.time() - self.built
+
+
+    def lookup(self, mem:int, cores:int, hours:float) -> Tuple[str]:
+        """
+        The names of the partitions where a job of this size fits,
+        most idle first. The tests are those in the constraints of
+        dialog.mem, dialog.cores, and dialog.time. The answers are
+        kept in self.found, so they go away with the Recommender.
+        """
+        key = mem, cores, hours
+        if key in self.found: return self.found[key]
+        if mem <= 1 or cores <= 0: return ()
+
+        fits = [ (rank, name) 
+            for ram, most_cores, max_hours, rank, name in self.entries[bisect.bisect_left(self.ram, mem):]
+            if cores <= most_cores and hours <= max_hours ]
+        self.found[key] = tuple(name for rank, name in sorted(fits))
+        return self.found[key]
@@ -14,21 +14,28 @@ import os.path
 import sys
 
 import datetime
+import functools
 import getpass
 import grp
+import math
 import pwd
 import socket
+import subprocess
 import time
+import types
 # Putting this import first, we can run pip if we need any of the
 # packages named in the try-block.
 import utils
 
-import dateparser
-
 ###
 # Other parts of this project.
 ###
+import clusterindex
+import jobspec
+import moduletrie
+import recommend
 from   sloppytree import SloppyTree
+import timings
 
 def NOP(o:object): return o
 
@@ -46,95 +53,544 @@ limits.cores.leftover = 2
 params = SloppyTree()
 
 ###
-# These two tuples must be edited for the computer where SLURM is
-# being used. There is no obvious way to find the installed software.
-###
-params.locations.programs = tuple( os.getenv('PATH').split(':') )
-params.modulefiles = tuple(utils.all_module_files())
-params.programs = {
-    'amber':'',
-    'bbmap':'',
-    'BEAST':'',
-    'bedtools':'',
-    'bwa':'',
-    'cms':'',
-    'Columbus':'',
-    'gatk':'',
-    'gaussian':'',
-    'ImageJ':'',
-    'mothur':'',
-    'NAMD':'',
-    'OpenMolcas':'',
-    'picard':'',
-    'plink':'',
-    'qchem':'',
-    'qe':'',
-    'samtools':'',
-    'varscan':'',
-    'vcft':''
-    }
-
-def program_basename(t:SloppyTree) -> SloppyTree:
-    if t.program.answer == "": return t
-    for p in params.programs:
-        if t.program.answer.startswith(p):
-            t.modules = f"module load {p}/{t.program.answer}"
-            return t
-    return t
+# The description of the cluster is kept on local disk and shared
+# by everyone on this node, so that starting slurmwriter is a file
+# read rather than a call to sinfo. ttl is in seconds.
+###
+params.cache.dir = os.getenv('SLURMWRITER_CACHE', '/dev/shm/slurmwriter')
+params.cache.ttl = 300
+
+###
+# What belongs to one user (groups, modules, software, usage, and
+# the daemon's socket) is kept in a directory of the user's own in
+# the cache, where no one else can replace it.
+###
+params.cache.mine = os.path.join(params.cache.dir, mynetid)
 
+###
+# Each user's swdaemon listens on its own socket, and goes away
+# after idle seconds without a request.
+###
+params.daemon.socket = os.path.join(params.cache.mine, "daemon.sock")
+params.daemon.idle = 60*60
 
-def program_launch(t:SloppyTree) -> SloppyTree:
-    t.joblines = f"{t.program.answer} {t.inputfile.answer}"
+###
+# A user's groups are remembered for ttl seconds. If check_slurm
+# is True, only the groups that SLURM knows as accounts are offered.
+###
+params.groups.check_slurm = True
+params.groups.ttl = 60*60
+
+###
+# The shared index is built by the administrators with
+# "python clusterindex.py --build", from cron. If it is missing,
+# or older than ttl seconds, we find things out for ourselves.
+###
+params.sharedindex.file = os.getenv('SLURMWRITER_INDEX', '/usr/local/sw/slurmwriter/cluster.idx')
+params.sharedindex.ttl = 24*60*60
+
+###
+# What earlier jobs used is kept in a SQLite file, and new records are
+# asked of sacct every ttl seconds; the first time, the last days days.
+# overlap seconds before the latest record are asked for again, for
+# the jobs that were not yet in accounting then. The defaults for
+# memory, cores, and time are the percentile of the user's latest
+# window jobs with the same program, times headroom, if there are at
+# least min_jobs of them.
+###
+params.usage.file = os.getenv('SLURMWRITER_USAGE', os.path.join(params.cache.mine, "usage.db"))
+params.usage.checked = os.path.join(params.cache.mine, "usage.checked")
+params.usage.ttl = 60*60
+params.usage.days = 90
+params.usage.overlap = 60*60
+params.usage.percentile = 90
+params.usage.headroom = 1.25
+params.usage.window = 100
+params.usage.min_jobs = 5
+
+###
+# Nothing that is expensive to find out is computed when this file
+# is imported. Each of these functions does the work the first time
+# a prompt, default, or constraint asks for it, and remembers the
+# result for the rest of the run.
+###
+
+@functools.lru_cache(maxsize=None)
+@timings.timed('group lookup')
+def account_groups() -> Tuple[str]:
+    """
+    The groups (SLURM accounts) of the user running the program.
+    """
+    return tuple(utils.cached_tree(
+        os.path.join(params.cache.mine, "groups.json"),
+        build_groups, params.groups.ttl).groups)
+
+
+def build_groups(accounts_result:tuple=None) -> SloppyTree:
+    """
+    The tree that account_groups keeps in the cache.
+    """
+    t = SloppyTree()
+    t.groups = list(utils.mygroups(params.groups.check_slurm, accounts_result))
     return t
 
 
-def program_jobfile(t:SloppyTree) -> SloppyTree:
+def default_group() -> str:
+    """
+    The account a job is charged to if the user does not say.
+    """
+    groups = account_groups()
+    try:
+        return [ g for g in groups if "$" in g ][0]
+    except:
+        return groups[0]
+
+
+@functools.lru_cache(maxsize=None)
+@timings.timed('module scan')
+def module_files() -> Tuple[str]:
+    """
+    All the module files in the MODULEPATH. The index is per-user
+    because each user may have a different MODULEPATH.
+    """
+    if shared_index() is not None:
+        return tuple(path for name, version, path in shared_index().modules())
+    return tuple(utils.all_module_files(
+        os.path.join(params.cache.mine, "modules.json")))
+
+
+_partitions = None
+def partitions(refresh:bool=False) -> SloppyTree:
+    """
+    Partitions represent where you want to run the program. It is a n-ary tree,
+    where the first layer of keys represents the partitions. Subsequent layers
+    are tree-nodes with properties of the partition.
+    """
+    global _partitions
+    if _partitions is None or refresh:
+        with timings.timer('partitions'):
+            if not refresh and shared_index() is not None:
+                _partitions = shared_index().partitions()
+            else:
+                _partitions = utils.cluster_description(params, refresh)
+    return _partitions
+
+
+_recommender = None
+def recommender() -> recommend.Recommender:
+    """
+    The partitions that are open to everyone, ranked by how much of
+    them is idle. It is rebuilt when the node state is out of date.
+    """
+    global _recommender
+    if _recommender is None or _recommender.age() > params.nodestate.ttl:
+        state = utils.cached_tree(
+            os.path.join(params.cache.dir, 'nodestate.json'),
+            lambda : utils.parse_node_state(params),
+            params.nodestate.ttl)
+        _recommender = recommend.Recommender(partitions(), limits, state, 
+            community_partitions_plenum())
+    return _recommender
+
+
+def recommended_partition(mem:object=None, cores:object=None, hours:object=None) -> str:
+    """
+    The best partition for a job of this size, or the default
+    partition if none fits or SLURM will not say how busy it is.
+    Sizes that are not given are the dialog's defaults.
+    """
+    try:
+        if not recommender().has_state: return partitions().default_partition
+        best = recommender().lookup(
+            int(mem if mem not in (None, "") else dialog.mem.default(None)),
+            int(cores if cores not in (None, "") else dialog.cores.default(None)),
+            float(hours if hours not in (None, "") else dialog.time.default(None)))
+    except Exception as e:
+        best = ()
+    return best[0] if best else partitions().default_partition
+
+
+def refresh_usage() -> None:
+    """
+    Start a process that adds the jobs that have finished since we
+    last asked to the usage store, at most once every params.usage.ttl
+    seconds. Nothing waits for it; the defaults come from what the
+    store already has. The time of params.usage.checked is when we
+    last tried, so a sacct that fails is not tried on every start.
+    """
+    if not params.usage.ttl: return
+    lockfd = utils.claim_refresh(params.usage.checked, params.usage.ttl)
+    if lockfd is None: return
+    try:
+        with open(params.usage.checked, 'a'): os.utime(params.usage.checked)
+        subprocess.Popen([sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usage.py'),
+            '--ingest', '--output', params.usage.file],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True)
+    except OSError as e:
+        pass
+    finally:
+        os.close(lockfd)
+
+
+@functools.lru_cache(maxsize=None)
+def shared_index() -> clusterindex.ClusterIndex:
+    """
+    The index of modules and partitions built by the administrators,
+    or None if there is no usable one.
+    """
+    return clusterindex.open_index(params.sharedindex.file, params.sharedindex.ttl)
+
+
+def usage_default(k:str, job:object, fallback:float) -> float:
+    """
+    What the user's jobs with this program have usually used of k
+    (mem, cores, or time), with some headroom, but no more than the
+    partition allows. fallback if there is not enough history.
+    """
+    program = (getattr(job, 'program', None) or "").split()
+    found = usual_usage(program[0] if program else "").get(k)
+    if found is None: return fallback
+
+    found *= params.usage.headroom
+    if k == 'mem': value = max(2, math.ceil(found))
+    elif k == 'cores': value = max(1, math.ceil(found))
+    else: value = max(0.25, math.ceil(found * 4) / 4)
+
+    try:
+        partition = partitions()[job.partition]
+        most = {'mem' : partition.ram - limits.ram.leftover,
+            'cores' : partition.cores - limits.cores.leftover,
+            'time' : partition.max_hours}[k]
+        return min(value, most)
+    except Exception as e:
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def usage_store() -> 'usage.UsageStore':
+    """
+    The record of what earlier jobs used, or None if there is none.
+    sqlite3 is slow to import, so it waits until there is a store.
+    """
+    if not os.path.exists(params.usage.file): return None
+    import usage
+    return usage.open_store(params.usage.file)
+
+
+@functools.lru_cache(maxsize=None)
+@timings.timed('usage lookup')
+def usual_usage(program:str) -> dict:
+    store = usage_store()
+    if store is None: return {}
+    try:
+        return store.usual(mynetid, program, params.usage.percentile, 
+            params.usage.window, params.usage.min_jobs)
+    except Exception as e:
+        return {}
+
+
+def warm(refresh:bool=False) -> None:
+    """
+    Ask SLURM, all at once, the questions that the dialog would
+    otherwise ask one after another as it comes to them: what the
+    partitions are, how busy they are, and what the user's accounts
+    are. Only what is missing from the cache, or out of date, is asked
+    for, and the answers are put in the cache where partitions(),
+    recommender(), and account_groups() will find them. The usage
+    store is brought up to date in the background. Anything that goes wrong here is left for those functions
+    to find out.
+
+    refresh -- ask about the partitions and nodes even if the cache
+        is up to date, as for --refresh-cluster.
+    """
+    global _partitions, _recommender
+
+    partitions_file = os.path.join(params.cache.dir, 'partitions.json')
+    nodestate_file = os.path.join(params.cache.dir, 'nodestate.json')
+    groups_file = os.path.join(params.cache.mine, "groups.json")
+
+    ###
+    # A cache file is refreshed by the process that holds its lock,
+    # as in utils.cached_tree, so that everyone starting at once on
+    # a busy login node does not ask SLURM the same question. sinfo
+    # is found by the PATH search of the probe itself, rather than
+    # by a `which sinfo` before the others can start.
+    ###
+    locks = {}
+    probes = {}
+    if (refresh or _partitions is None and shared_index() is None and 
+        utils.file_age(partitions_file) >= params.cache.ttl):
+        locks['partitions'] = utils.claim_refresh(partitions_file, params.cache.ttl, refresh)
+        probes['partitions'] = f"sinfo {params.querytool.opts}"
+    if refresh or utils.file_age(nodestate_file) >= params.nodestate.ttl:
+        locks['nodestate'] = utils.claim_refresh(nodestate_file, params.nodestate.ttl, refresh)
+        probes['nodestate'] = f"sinfo {params.nodestate.opts}"
+    if params.groups.check_slurm and utils.file_age(groups_file) >= params.groups.ttl:
+        locks['accounts'] = utils.claim_refresh(groups_file, params.groups.ttl)
+        probes['accounts'] = utils.slurm_accounts_command(mynetid)
+    for name, lockfd in locks.items():
+        if lockfd is None: probes.pop(name)
+    refresh_usage()
+    if not probes: return
+
+    try:
+        with timings.timer('slurm probes'):
+            results = utils.dorunrun_all(probes, timeout=30, return_datatype=tuple)
+
+        for name, filename, parse in (
+            ('partitions', partitions_file, utils.parse_sinfo),
+            ('nodestate', nodestate_file, utils.parse_node_state) ):
+            result = results.get(name)
+            if not isinstance(result, tuple) or result[0] != 0: continue
+            try:
+                tree = parse(params, result[1])
+            except Exception as e:
+                continue
+            utils.write_tree(filename, tree)
+            if name == 'partitions': _partitions = tree
+            else: _recommender = None
+
+        if 'accounts' in results:
+            utils.write_tree(groups_file, build_groups(results['accounts']))
+            account_groups.cache_clear()
+
+    finally:
+        for lockfd in locks.values():
+            if lockfd is not None: os.close(lockfd)
+
+
+@functools.lru_cache(maxsize=None)
+def querytool() -> str:
+    """
+    If we cannot find the 'sinfo' program, then this is not a SLURM
+    machine, or the current user does not have SLURM utilities in
+    the PATH.
+    """
+    exe = utils.dorunrun("which sinfo", return_datatype=str).strip()
+    if not exe:
+        sys.stderr.write('SLURM does not appear to be on this machine.')
+        sys.exit(os.EX_SOFTWARE)
+    return exe
+
+
+@functools.lru_cache(maxsize=None)
+def submittool() -> str:
+    """
+    Find sbatch the same way we find sinfo.
+    """
+    exe = utils.dorunrun("which sbatch", return_datatype=str).strip()
+    if not exe:
+        sys.stderr.write('SLURM does not appear to be on this machine.')
+        sys.exit(os.EX_SOFTWARE)
+    return exe
+
+
+###
+# Programs are found in the directories of params.locations.programs,
+# and in the module files. What is found is kept for ttl seconds, or
+# until the PATH or MODULEPATH changes.
+###
+params.locations.programs = tuple( _ for _ in os.getenv('PATH', "").split(':') if _ )
+params.modulefiles = module_files
+params.software.ttl = 60*60
+
+###
+# The foo hooks are given the draft of the job being built (see
+# the notes above the dialog), and return it.
+###
+
+def program_basename(job:types.SimpleNamespace) -> types.SimpleNamespace:
+    """
+    If the program is a module, load exactly that module, and run the
+    program by its own name: gatk-4.2.0.0 becomes "module load
+    gatk/4.2.0.0" and gatk.
+
+    The job's comment names the program for usage.parse_sacct. It has
+    only the name, because the arguments may have quotes of their own.
+    """
+    name, _, args = job.program.strip().partition(' ')
+    found = resolve_module(name) if name else ()
+    if len(found) == 1:
+        module, version = found[0]
+        job.modules = f"module load {module}/{version}" if version else f"module load {module}"
+        if name not in find_software().executables:
+            job.program = f"{module.rpartition('/')[2]} {args}".strip()
+
+    job.comment = " ".join(["slurmwriter", *job.program.split()[:1]]).translate(
+        str.maketrans('', '', '"\\'))
+    return job
+
+
+def program_launch(job:types.SimpleNamespace) -> types.SimpleNamespace:
+    job.joblines = f"{job.program} {job.inputfile}"
+    return job
+
+
+def program_array_launch(job:jobspec.JobSpec) -> str:
+    """
+    The joblines for one task of a job array. The task finds its
+    parameters on its own line of the table in job.array_table, whose
+    first line names the columns. The columns become shell variables;
+    inputfile and args, if they are columns, go on the command line.
+    """
+    names = " ".join(job.array_variables)
+    inputfile = "$inputfile" if 'inputfile' in job.array_variables else job.inputfile
+    args = "$args " if 'args' in job.array_variables else ""
+    return f"""IFS=$'\\t' read -r {names} < <(sed -n "$((SLURM_ARRAY_TASK_ID+2))p" "{job.array_table}")
+export {names}
+{job.program} {args}{inputfile}"""
+
+
+def program_jobfile(job:types.SimpleNamespace) -> types.SimpleNamespace:
     global mynetid
-    data=t.jobfile.answer
-    if not data: return t
+    data=job.jobfile
+    if not data: return job
 
     filename=f"/tmp/{mynetid}.recent"
     with open(filename, 'w') as f:
-        f.write(t.jobfile.answer)
-    return t
+        f.write(job.jobfile)
+    return job
 
 
+@functools.lru_cache(maxsize=None)
+@timings.timed('software scan')
 def find_software() -> SloppyTree:
     """
     Find the software that is installed on the current machine
     based on the places we know to look. 
+
+    returns -- a tree with the executables, name -> path, the modules,
+        name -> [versions], the versions that are the defaults, name ->
+        version, and the locations that were searched.
+    """
+    locations = [ list(params.locations.programs), os.getenv('MODULEPATH', "") ]
+    filename = os.path.join(params.cache.mine, "software.json")
+
+    def build() -> SloppyTree:
+        t = SloppyTree()
+        t.locations = locations
+        t.executables = utils.find_executables(params.locations.programs)
+        t.modules = {}
+        t.defaults = {}
+        for name, version, path in installed_modules():
+            if name not in t.modules:
+                default = utils.module_default(os.path.dirname(path) if version else "")
+                if default: t.defaults[name] = default
+            if version != 'default':
+                t.modules.setdefault(name, []).append(version)
+        return t
+
+    software = utils.cached_tree(filename, build, params.software.ttl)
+    if software.locations != locations:
+        software = utils.cached_tree(filename, build, params.software.ttl, refresh=True)
+    return software
+
+
+def installed_modules() -> Tuple[str, str, str]:
     """
-    locations = params[socket.gethostname().split('.')[0]].locations
-    pass
+    A generator of (name, version, path) for each module file.
+    """
+    if shared_index() is not None:
+        yield from shared_index().modules()
+        return
+
+    locations = [ utils.expandall(_).rstrip('/') for _ in os.getenv('MODULEPATH', "").split(':') if _ ]
+    for path in module_files():
+        location = max(( _ for _ in locations if path.startswith(f"{_}/") ), key=len, default=None)
+        if location is not None:
+            yield (*utils.module_name_version(location, path), path)
+
+
+def is_installed(program:str) -> bool:
+    """
+    True if the first word of program is an executable we know about,
+    or names exactly one module, or is the full path of a program the
+    user can run.
+    """
+    name = program.split()[0]
+    if name.startswith('/'): return os.access(name, os.X_OK)
+    return name in find_software().executables or len(resolve_module(name)) == 1
+
+
+@functools.lru_cache(maxsize=None)
+def module_trie() -> moduletrie.ModuleTrie:
+    software = find_software()
+    return moduletrie.ModuleTrie(software.modules, software.defaults)
+
+
+def resolve_module(name:str) -> Tuple[Tuple[str, str]]:
+    """
+    The modules that name could mean; see moduletrie. The start of a
+    module's name is not enough when it is also the name of a program.
+    """
+    if name.startswith('/'): return ()
+    return module_trie().resolve(name, complete=name not in find_software().executables)
+
+
+def similar_programs(program:str, n:int=20) -> List[str]:
+    """
+    The modules the program could mean, if it could mean more than
+    one. Otherwise, a few of the programs whose names start the way
+    program does.
+    """
+    name = program.split()[0]
+    found = resolve_module(name)
+    if len(found) > 1:
+        return [ f"{module}/{version}" if version else module for module, version in found ]
 
+    start = name[:2]
+    return sorted(set(module_trie().candidates(start, n)).union(
+        _ for _ in find_software().executables if _.startswith(start)))[:n]
+
+
+###
+# A parameter sweep becomes one job array. max_size must agree with
+# MaxArraySize in slurm.conf; throttle is the number of tasks that
+# may run at once, unless the sweep says otherwise. The parameters
+# become shell variables in each task, so they may not be named for
+# a variable that is already set, or that the template uses.
+###
+params.array.max_size = 1001
+params.array.throttle = 50
+params.array.reserved = frozenset(('BASH_ENV', 'BIGSCRATCH', 'CDPATH', 'DATADIR', 
+    'ENV', 'HOME', 'IFS', 'JOBID', 'JOBNAME', 'LD_LIBRARY_PATH', 'LD_PRELOAD', 
+    'MODULEPATH', 'NETID', 'OLDPWD', 'OPTARG', 'OPTIND', 'PATH', 'PS4', 'PWD', 
+    'REPLY', 'SCRATCH', 'SHELL', 'TMPDIR', 'USER'))
 
-# If we cannot find the 'sinfo' program, then this is not a SLURM
-# machine, or the current user does not have SLURM utilities in
-# the PATH.
 params.querytool.opts = '-o "%50P %10c  %10m  %25f  %10G %l"'
-params.querytool.exe = utils.dorunrun("which sinfo", return_datatype=str).strip()
-if not params.querytool.exe:
-    sys.stderr.write('SLURM does not appear to be on this machine.')
-    sys.exit(os.EX_SOFTWARE)
+params.querytool.exe = querytool
+
+###
+# --submit hands the jobs to sbatch with a few workers, at no more
+# than rate jobs per second. When the controller is busy, a worker
+# waits backoff seconds, doubling up to max_backoff, and gives up
+# on the job after retries attempts.
+###
+params.submit.exe = submittool
+params.submit.rate = 5
+params.submit.workers = 4
+params.submit.retries = 6
+params.submit.backoff = 1
+params.submit.max_backoff = 60
+params.submit.timeout = 30
 
+###
+# How busy the nodes are is used to recommend a partition. It
+# changes quickly, so it is only kept for ttl seconds.
+###
+params.nodestate.opts = '-N -h -O "NodeList:50,Partition:50,CPUsState:30,FreeMem:20"'
+params.nodestate.ttl = 60
 
-# Partitions represent where you want to run the program. It is a n-ary tree,
-# where the first layer of keys represents the partitions. Subsequent layers
-# are tree-nodes with properties of the partition.
-partitions = utils.parse_sinfo(params)
-all_partitions = set(( k for k in partitions.keys() ))
+all_partitions = lambda : set(( k for k in partitions().keys() ))
 
 # This is a list of condos on Spydur. It will not hurt anything to
 # leave the code in place, as the set subtraction will have no effect.
 condos = set(('bukach', 'diaz', 'erickson', 'johnson', 'parish', 'yang1', 'yang2', 'yangnolin'))
-community_partitions_plenum = all_partitions - condos
+community_partitions_plenum = lambda : all_partitions() - condos
 
 
-# programs contains the user-level concepts about the software on this cluster.
-programs = SloppyTree()
-for p in params.programs:
-    programs[p] = None
-
 ###
 # Each of the trees is a decision tree for the user. Some notes about the
 # elements.
@@ -148,90 +604,93 @@ for p in params.programs:
 #  datatype -- int, str, float, list, etc. Effectively, these are lambda-s
 #       because the program coerces the input to this type from str.
 #  constraints -- a tuple of lambda-s to check allowable values.
+#
+# The answers are not kept in the tree. Each job has its own draft,
+# with an attribute for each answer given so far (job.partition, for
+# example), and the draft is frozen into a jobspec.JobSpec when the
+# questions are done. So that the answers can depend on each other,
+# the draft is passed to
+#
+#       default(job), constraints(x, job), messages(x, job), foo(job)
 ###
 
 dialog = SloppyTree()
 
-dialog.joblines = ""
-dialog.modules = ""
 dialog.written.foo = lambda : time.strftime(
     '%Y-%m-%d %H:%M:%S', 
     time.localtime(time.time()))
 
 dialog.username.answer = mynetid
-dialog.username.groups = utils.mygroups() 
-try:
-    dialog.username.defaultgroup = [ g for g in dialog.username.groups if "$" in g ][0] 
-except:
-    dialog.username.defaultgroup = dialog.username.groups[0]
+dialog.username.groups = account_groups
+dialog.username.defaultgroup = default_group
 
 dialog.jobname.prompt = lambda : "Name of your job"
 dialog.jobname.datatype = str
 
 dialog.program.prompt = lambda : "What program do you want to run? (skip to fill in later)"
-dialog.program.default = lambda : ""
+dialog.program.default = lambda job : ""
 dialog.program.datatype = str
-dialog.program.constraints = lambda x : not len(x) or any(x.startswith(y) for y in params.programs),
-dialog.program.messages = lambda x : f"""{x} is not a program on Spydur. 
-    Available programs are {params.programs}""", 
+dialog.program.constraints = lambda x, job : not len(x) or is_installed(x),
+dialog.program.messages = lambda x, job : f"""{x} is not a program on Spydur, or is more than one.
+    Did you mean one of {similar_programs(x)}?""", 
 dialog.program.foo = program_basename
 
 dialog.inputfile.prompt = lambda : "Name of your input file"
-dialog.inputfile.default = lambda : ""
+dialog.inputfile.default = lambda job : ""
 dialog.inputfile.datatype = str
 dialog.inputfile.foo = program_launch
 
 dialog.partition.prompt = lambda : "Name of the partition where you want to run your job?"
-dialog.partition.default = lambda : f"{partitions.default_partition}"
+dialog.partition.default = lambda job : f"{recommended_partition()}"
 dialog.partition.datatype = str
-dialog.partition.constraints = lambda x : x in partitions,
-dialog.partition.messages = lambda x : f"{x} is not the name of a partition. They are {tuple(_ for _ in partitions.keys())}.",
+dialog.partition.constraints = lambda x, job : x in partitions(),
+dialog.partition.messages = lambda x, job : f"{x} is not the name of a partition. They are {tuple(_ for _ in partitions().keys())}.",
 
 dialog.account.prompt = lambda : f"What account is your user id, {mynetid}, associated with?"
-dialog.account.default = lambda : f"{dialog.username.defaultgroup}"
+dialog.account.default = lambda job : f"{dialog.username.defaultgroup()}"
 dialog.account.datatype = str
-dialog.account.constraints = lambda x : x in dialog.username.groups,
-dialog.account.messages = lambda x : f"{x} is not one of your groups. They are {dialog.username.groups}",
+dialog.account.constraints = lambda x, job : x in dialog.username.groups(),
+dialog.account.messages = lambda x, job : f"{x} is not one of your groups. They are {dialog.username.groups()}",
 
 dialog.mem.prompt = lambda : "How much memory (in GB)?"
-dialog.mem.default = lambda : 16
+dialog.mem.default = lambda job : usage_default('mem', job, 16)
 dialog.mem.datatype = int
-dialog.mem.constraints = lambda x : 1 < x <= partitions[dialog.partition.answer].ram - limits.ram.leftover, 
-dialog.mem.messages = lambda x : f"In {dialog.partition.answer}, \
-the maximum amount of memory is {partitions[dialog.partition.answer].ram - limits.ram.leftover}",
+dialog.mem.constraints = lambda x, job : 1 < x <= partitions()[job.partition].ram - limits.ram.leftover, 
+dialog.mem.messages = lambda x, job : f"In {job.partition}, \
+the maximum amount of memory is {partitions()[job.partition].ram - limits.ram.leftover}",
 
 dialog.cores.prompt = lambda : "How many cores?"
-dialog.cores.default = lambda : 8
+dialog.cores.default = lambda job : usage_default('cores', job, 8)
 dialog.cores.datatype = int
-dialog.cores.constraints = lambda x : 0 < x <= partitions[dialog.partition.answer].cores - limits.cores.leftover,
-dialog.cores.messages = lambda x : f"You may ask for a maximum of {partitions[dialog.partition.answer].cores - limits.cores.leftover} \
-cores for jobs in {dialog.partition.answer}.",
+dialog.cores.constraints = lambda x, job : 0 < x <= partitions()[job.partition].cores - limits.cores.leftover,
+dialog.cores.messages = lambda x, job : f"You may ask for a maximum of {partitions()[job.partition].cores - limits.cores.leftover} \
+cores for jobs in {job.partition}.",
 
 dialog.time.prompt = lambda : "How long should this run (in hours)?"
-dialog.time.default = lambda : 1
+dialog.time.default = lambda job : usage_default('time', job, 1)
 dialog.time.datatype = float
-dialog.time.constraints = lambda x : x <= partitions[dialog.partition.answer].max_hours,
+dialog.time.constraints = lambda x, job : x <= partitions()[job.partition].max_hours,
 dialog.time.reformat = lambda x : utils.hours_to_hms(x)
-dialog.time.messages = lambda x : f"The maximum run time is {partitions[dialog.partition.answer].max_hours}.",
+dialog.time.messages = lambda x, job : f"The maximum run time is {partitions()[job.partition].max_hours}.",
 
 dialog.start.prompt = lambda : "When do you want the job to run?"
-dialog.start.default = lambda : "now"
+dialog.start.default = lambda job : "now"
 dialog.start.datatype = str
-dialog.start.constraints = lambda x : x in ('now', 'today', 'tomorrow') or utils.time_check(x),
+dialog.start.constraints = lambda x, job : x in ('now', 'today', 'tomorrow') or utils.time_check(x),
 dialog.start.reformat = lambda x : utils.time_check(x, True)
 
 dialog.jobfile.prompt = lambda : "What will be the name of this new jobfile?"
-dialog.jobfile.default = lambda : f"/home/{dialog.username.answer}/{dialog.jobname.answer}.slurm"
+dialog.jobfile.default = lambda job : f"/home/{job.username}/{job.jobname}.slurm"
 dialog.jobfile.datatype = str
-dialog.jobfile.constraints = lambda x : os.access(os.path.dirname(x), os.W_OK),
-dialog.jobfile.messages = lambda x : f"Either {x} doesn't exist, or you cannot write to it.",
+dialog.jobfile.constraints = lambda x, job : os.access(os.path.dirname(x), os.W_OK),
+dialog.jobfile.messages = lambda x, job : f"Either {x} doesn't exist, or you cannot write to it.",
 dialog.jobfile.foo = program_jobfile
 
 # This is the catch all message if we cannot tell the user something
 # more specific.
 for k in ( _ for _ in dialog.keys() if 'prompt' in _):
     if 'messages' not in dialog[k]:
-        dialog[k].messages = lambda x : f"The value you supplied, {x}, cannot be used here.",
+        dialog[k].messages = lambda x, job : f"The value you supplied, {x}, cannot be used here.",
 
 # print(dialog)
 # sys.exit(os.EX_OK)
@@ -1,16 +1,26 @@
 slurmwriter()
 {
-    location=/tmp/$(whoami).recent
+    local sw=/usr/local/sw/slurmwriter
+    local location=/tmp/$(whoami).recent
     rm -f $location
-    export oldsw="$sw"
-    export sw=/usr/local/sw
-    command pushd $sw/slurmwriter > /dev/null
+
+    # A manifest of jobs goes to the user's resident daemon through
+    # the thin client, which starts the daemon if it is not running.
+    # Unless it finished (0), or finished with bad records (EX_DATAERR,
+    # 65), the manifest is written the ordinary way instead.
+    if [ "$1" == "--manifest" ] && [ $# -eq 2 ] && [[ "$2" != *.csv ]]; then
+        python $sw/swclient.py "$2"
+        case $? in
+            0|65) ;;
+            *) echo "Writing the manifest without the daemon."
+               python $sw/slurmwriter.py "$@" ;;
+        esac
+        return
+    fi
+
     clear
-    python slurmwriter.py $@
-    command popd > /dev/null
-    export sw=$oldsw
+    python $sw/slurmwriter.py "$@"
     
-    location=/tmp/$(whoami).recent
     if [ -f $location ]; then
         vim $(cat $location)
     fi
@@ -6,6 +6,9 @@ to construct, and by answering a few questions, this utility
 can help you get the basics correct the first time. 
 """
 
+import time
+started = time.perf_counter()
+
 import typing
 from   typing import *
 
@@ -34,22 +37,34 @@ __status__ = 'Teaching example'
 __license__ = 'MIT'
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import datetime
 import getpass
+import hashlib
 import inspect
-import time
+import itertools
+import json
+import multiprocessing
+import types
 
 ###
 # Parts of this project.
 ###
 
+import timings
+import batchcheck
+from   jobspec import JobSpec
 from   gkfdecorators import trap
-from   dorunrun import dorunrun
-import rules
-from   rules import dialog, partitions, programs
+with timings.timer('import rules'):
+    import rules
+from   rules import dialog, partitions
 from   sloppytree import SloppyTree
-from   script import slurmscript
+from   script import array_job, templates
+import submit
 import utils
+timings.record('imports', time.perf_counter() - started)
 
 ###
 # Useful constants.
@@ -58,8 +73,18 @@ import utils
 LAMBDA = lambda:0
 OCTOTHORPE = '#'
 INTERACTIVE = not utils.script_driven()
+TEMPLATE = templates['site']
+# The jobs written by the last run of the manifest, digest -> jobfile.
+WRITTEN_BEFORE = {}
 VERSION = datetime.datetime.fromtimestamp(os.stat(__file__).st_mtime).isoformat()[:16]
 
+###
+# Seconds we are willing to spend between starting the interpreter
+# and showing the first prompt. Nothing in rules.py runs until the
+# dialog asks for it, so this is mostly the cost of the imports.
+###
+STARTUP_BUDGET = 0.1
+
 @trap
 def dump_cmdline(args:argparse.ArgumentParser, return_it:bool=False) -> str:
     """
@@ -87,23 +112,68 @@ def dump_lambdas(o:Any) -> None:
     
 
 @trap
-def format_prompt(t:SloppyTree) -> str:
+def format_prompt(t:SloppyTree, job:types.SimpleNamespace) -> str:
     """
     Based on the prompt string and optional default value
     to collect data for the "t" node in the tree, build a
     uniform prompt string.
     """
-    if 'default' in t:
-        d_str = f"[{t.default()}] "
-    else:
-        t.default = ""
-        d_str = ""
+    d_str = f"[{t.default(job)}] " if 'default' in t else ""
 
     return f"{t.prompt()} {d_str}: " 
 
 
+def check_answer(t:SloppyTree, x:str, job:types.SimpleNamespace,
+    constrain:bool=True) -> Tuple[bool, Any, List[str]]:
+    """
+    Convert x to the datatype of the node t, check it against the
+    constraints, and reformat it. job is the draft of the job, with
+    the answers to the questions before this one. If constrain is
+    False, x has been checked already, and the constraints are not.
+
+    returns -- (True if x can be used, x as it should be recorded,
+        the messages to help the user get it right next time.)
+    """
+    if not x and callable(t.get('default')): x = t.default(job)
+
+    # Convert the user's response to the right type.
+    if 'datatype' in t:
+        try:
+            x = t.datatype(x)
+
+        # Not convertable to the give type.
+        except ValueError as e:
+            return False, x, [f"Woops! {x} should be of type {t.datatype}"]
+
+    ###
+    # Check the constraints. A constraint that cannot be evaluated
+    # (for example, a limit of a partition that does not exist) is
+    # a constraint that is not met.
+    ###
+    try:
+        complete = (not constrain or 'constraints' not in t or
+            all(constraint(x, job) for constraint in t.constraints))
+    except Exception as e:
+        complete = False
+
+    if not complete:
+        messages = []
+        for message in t.messages or ():
+            try:
+                messages.append(message(x, job))
+            except Exception as e:
+                messages.append(f"The value you supplied, {x}, cannot be used here.")
+        return False, x, messages or [f"{x!r} is not acceptable."]
+
+    # Check for reformatting (mainly the case for timestamps)
+    if 'reformat' in t:
+        x = t.reformat(x)
+
+    return True, x, []
+
+
 @trap
-def get_answers(t:SloppyTree, myargs:argparse.Namespace) -> SloppyTree:
+def get_answers(t:SloppyTree, myargs:argparse.Namespace) -> JobSpec:
     """
     Walk the nodes of the tree to collect information
     from the user, interactively. Perform checks for
@@ -111,77 +181,444 @@ def get_answers(t:SloppyTree, myargs:argparse.Namespace) -> SloppyTree:
     """
     global INTERACTIVE
 
+    job = new_draft(t)
+
     # Ensure this is a user-prompt element of t. Other data in
     # t have no prompt element. 
     for k in ( _ for _ in t.keys() if 'prompt' in t[_]):
 
         complete = False
         while not complete:
-            # Convert the user's response to the right type.
-            x = scrub_input(format_prompt(t[k])) 
-            x = x if x else t[k].default()
-            try:
-                x = t[k].datatype(x)
-                complete = True
-
-            # Not convertable to the give type.
-            except ValueError as e:
-                print(f"Woops! {x} should be of type {t[k].datatype}")
-                if not INTERACTIVE: sys.exit(os.EX_DATAERR)
-                continue
-                
-            # No type coercion rule present.
-            except KeyError as e:
-                complete = True
-
-            # Step 2: Check the constraints.
-
+            x = scrub_input(format_prompt(t[k], job)) 
             myargs.debug and dump_lambdas(t[k].constraints)
-            
-            ###
-            # Explanation for the following statement:
-            #   complete if ( if we passed the type check AND
-            #    there are *no* constraints to consider OR
-            #    all choice functions return true )
-            ###
-            complete = ( complete and 
-                'constraints' not in t[k] or all (constraint(x) for constraint in t[k].constraints)
-                )
+            with timings.timer(f"validate {k}"):
+                complete, x, messages = check_answer(t[k], x, job)
 
             ###
             # Execute the message-rules to help the user get it right next time.
             ###
             if not complete:
-                if t[k].messages: 
-                    for message in t[k].messages: print(message(x))
+                for message in messages: print(message)
                 if not INTERACTIVE: sys.exit(os.EX_DATAERR)
-                continue
 
-            # Check for reformatting (mainly the case for timestamps)
-            if 'reformat' in t[k]:
-                x = t[k].reformat(x)
-            
         # Success.
-        t[k].answer = x
+        setattr(job, k, x)
         
         # Apply any tranformation associated with this element.
         try:
-            t = t[k].foo(t)
+            job = t[k].foo(job)
+        except:
+            pass
+
+    return JobSpec(**vars(job))
+
+
+def get_record_answers(t:SloppyTree, record:dict, lines:dict=None,
+    checked:Collection[str]=()) -> Tuple[JobSpec, List[str]]:
+    """
+    Answer the questions in t from one record of a manifest, the
+    way get_answers does from the user. If lines gives the line
+    number of each answer, the problems are reported with them.
+    The answers to the questions in checked have passed their
+    constraints already (see screen_records).
+
+    returns -- the job, and the problems with the record. If there
+        are problems, the job is None.
+    """
+    job = new_draft(t)
+    questions = [ _ for _ in t.keys() if 'prompt' in t[_] ]
+
+    errors = [ f"{k}: not a question slurmwriter asks." for k in record if k not in questions ]
+    failed = bool(errors)
+    for k in questions:
+        x = record.get(k)
+        with timings.timer(f"validate {k}"):
+            complete, x, messages = check_answer(t[k], "" if x is None else str(x).strip(), job,
+                k not in checked)
+        if not complete:
+            # The job is refused because the answer is, whatever was said about it.
+            failed = True
+            where = f"line {lines[k]}: " if lines else ""
+            errors.extend(f"{where}{k}: {message}" for message in messages)
+            continue
+
+        setattr(job, k, x)
+        try:
+            job = t[k].foo(job)
         except:
             pass
 
-    return t
+    return (None if failed else JobSpec(**vars(job))), errors
+
+
+@trap
+def manifest_main(myargs:argparse.Namespace) -> int:
+    """
+    Write a job for each record in the manifest. Problems are
+    written to the report, one JSON line per record, rather than
+    ending the run. 
+
+    With --jobs greater than one, the records are checked and written
+    by a pool of processes. The report is in the order of the
+    manifest, and the files are the same as they would be if they
+    were written one at a time.
+
+    A hash of each job is kept beside the manifest. When the manifest
+    is run again, a job whose hash is the same, and whose file is
+    still there, is checked but not written again.
+    """
+    global WRITTEN_BEFORE
+    report_name = myargs.report if myargs.report else f"{myargs.manifest}.report"
+    state_name = f"{myargs.manifest}.state"
+    counts = collections.Counter()
+    jobfiles = []
+
+    WRITTEN_BEFORE = {} if myargs.force else (utils.read_tree(state_name) or {})
+    new_state = {}
+
+    rules.warm(myargs.refresh_cluster)
+
+    # Every job in a manifest has the same creation time, so that
+    # the files do not depend on how quickly they were written.
+    written_at = dialog.written.foo()
+    dialog.written.foo = lambda : written_at
+
+    # The name of the last job is left for the shell function once,
+    # at the end, rather than by each job as it is written.
+    dialog.jobfile.foo = rules.NOP
+
+    records = ( (n, with_partition(record), error) 
+        for n, record, error in unique_jobfiles(utils.read_manifest(myargs.manifest)) )
+    if batchcheck.numpy is not None:
+        records = screen_records(records)
+
+    with contextlib.ExitStack() as stack:
+        if myargs.jobs > 1:
+            # Find out everything the checks need before the workers
+            # are forked, so that they inherit it rather than each
+            # asking SLURM and the directory service again.
+            partitions()
+            rules.account_groups()
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                max_workers=myargs.jobs, mp_context=multiprocessing.get_context('fork')))
+            results = itertools.chain.from_iterable(
+                pool.map(write_record, batch, chunksize=64)
+                for batch in utils.batches(records, 256*myargs.jobs))
+        else:
+            results = map(write_record, records)
+
+        report = stack.enter_context(open(report_name, 'w'))
+        for result in results:
+            digest = result.pop('digest')
+            if result['ok']: 
+                counts[result['status']] += 1
+                jobfiles.append(result['jobfile'])
+                new_state[digest] = result['jobfile']
+            else:
+                counts['failed'] += 1
+            report.write(json.dumps(result) + "\n")
+
+    utils.write_tree(state_name, new_state)
+    if jobfiles: rules.program_jobfile(types.SimpleNamespace(jobfile=jobfiles[-1]))
+    print(f"{counts['created']} jobs created, {counts['updated']} updated, "
+        f"{counts['unchanged']} unchanged, {counts['failed']} records with errors. See {report_name}", 
+        file=sys.stderr)
+    if myargs.submit and not submit_jobs(jobfiles, myargs): counts['failed'] += 1
+    return os.EX_OK if not counts['failed'] else os.EX_DATAERR
+
+
+def job_digest(job:JobSpec, template:object=None) -> str:
+    """
+    A hash of everything a job from a manifest depends on: its
+    answers, including the defaults it was given, the template
+    (TEMPLATE if not given), and the versions of rules.py and of
+    this file. When the job was written is left out.
+    """
+    answers = job.as_dict()
+    answers.pop('written', None)
+    key = json.dumps([answers, (template or TEMPLATE).text, rules.VERSION, VERSION], 
+        sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def new_draft(t:SloppyTree) -> types.SimpleNamespace:
+    """
+    The draft of a new job, before any questions are answered. It
+    belongs to this job alone; the dialog t is not changed.
+    """
+    return types.SimpleNamespace(username=t.username.answer, written=t.written.foo(),
+        modules="", joblines="", comment="slurmwriter")
+
+
+def screen_records(records:Iterable[Tuple[int, dict, str]]) -> Tuple[int, dict, str, FrozenSet[str]]:
+    """
+    Check the partitions and resources of the records a few thousand
+    at a time with batchcheck, and add to each record the fields
+    that write_record need not check again. A field the record
+    leaves out is checked again, because its default may depend on
+    the rest of the job. The records that fail the screen are checked
+    in full by write_record, so their errors are the same as they
+    would be without NumPy.
+    """
+    limits = batchcheck.PartitionLimits(partitions(), rules.limits)
+    for batch in utils.batches(records, 4096):
+        readable = [ record for n, record, error in batch if not error ]
+        mask, reasons = batchcheck.check_records(limits, readable, dialog)
+        results = iter(mask)
+        for n, record, error in batch:
+            passed = not error and next(results)
+            yield n, record, error, frozenset(
+                k for k in batchcheck.fields if passed and record.get(k) not in (None, ""))
+
+
+@trap
+def sweep_main(myargs:argparse.Namespace) -> int:
+    """
+    Write a parameter sweep as one job array. The sweep is a JSON
+    file like this:
+
+        { "job" : { the answers, as in a manifest record },
+          "product" : { "inputfile" : [ ... ], "args" : [ ... ] },
+          "zip" : { "seed" : [ ... ], "temperature" : [ ... ] },
+          "throttle" : 50 }
+
+    The parameters for the tasks are written to a table beside the
+    jobfile, one line per task, and each task reads its own line.
+    """
+    with open(myargs.sweep) as f:
+        spec = json.load(f)
+
+    job, errors = get_record_answers(dialog, with_partition(spec.get('job', {})))
+    product, zipped = spec.get('product') or {}, spec.get('zip') or {}
+    if not isinstance(product, dict) or not isinstance(zipped, dict):
+        print("product and zip must be JSON objects, like {\"seed\" : [1, 2]}.", file=sys.stderr)
+        return os.EX_DATAERR
+
+    variables = list(product) + list(zipped)
+    if not variables:
+        errors.append("The sweep has no parameters to vary.")
+    errors.extend(f"{v} cannot be the name of a shell variable." 
+        for v in variables if not v.isidentifier())
+    errors.extend(f"{v} is already a shell variable; choose another name." 
+        for v in variables 
+        if v in os.environ or v in rules.params.array.reserved or v.startswith('SLURM'))
+    errors.extend(f"The values of {k} must be a list." 
+        for k, v in itertools.chain(product.items(), zipped.items()) if not isinstance(v, list))
+
+    throttle = spec.get('throttle', rules.params.array.throttle)
+    if isinstance(throttle, bool) or not isinstance(throttle, int) or throttle < 1:
+        errors.append(f"The throttle must be a whole number greater than zero, not {throttle!r}.")
+
+    if not errors:
+        # The size is known before anything is expanded or written.
+        n = math.prod(len(v) for v in product.values()) * (
+            len(next(iter(zipped.values()))) if zipped else 1)
+        if n > rules.params.array.max_size:
+            errors.append(f"The sweep has {n} tasks; SLURM allows {rules.params.array.max_size}.")
+        elif not n:
+            errors.append("The sweep has no tasks.")
+
+    lines = ["\t".join(variables)]
+    try:
+        for i, task in enumerate(() if errors else utils.expand_sweep(product, zipped)):
+            values = [ str(task[v]) for v in variables ]
+            # The shell's read would run two tabs together, so no value may be empty.
+            if any(not v or '\t' in v or '\n' in v for v in values):
+                errors.append(f"Task {i}: parameters cannot be empty, or contain tabs or newlines.")
+                break
+            lines.append("\t".join(values))
+    except ValueError as e:
+        errors.append(str(e))
+
+    if errors:
+        for error in errors: print(error, file=sys.stderr)
+        return os.EX_DATAERR
+
+    table = f"{os.path.splitext(job.jobfile)[0]}.params"
+    job = job.replace(array_size=n, array_range=f"0-{n-1}%{throttle}",
+        array_table=table, array_variables=tuple(variables))
+    job = job.replace(joblines=rules.program_array_launch(job))
+
+    utils.atomic_write(table, "\n".join(lines) + "\n")
+    utils.atomic_write(job.jobfile, array_job.render(job))
+
+    print(f"Wrote {n} tasks to {table}, and the job array to {job.jobfile}")
+    if myargs.submit and not submit_jobs([job.jobfile], myargs): 
+        return os.EX_UNAVAILABLE
+    return os.EX_OK
+
+
+def submit_jobs(jobfiles:List[str], myargs:argparse.Namespace) -> bool:
+    """
+    Hand the jobfiles to sbatch, and tell the user how it went. The
+    job IDs are appended to the --jobids file. Returns True if every
+    job was submitted.
+    """
+    results_name = myargs.jobids if myargs.jobids else "slurmwriter.jobids"
+    submitted, failed = submit.submit_all(jobfiles, rules.params, results_name)
+    print(f"{submitted} jobs submitted, {failed} not submitted. See {results_name}",
+        file=sys.stderr)
+    return not failed
+
+
+def claim_jobfile(claimed:dict, n:int, record:dict) -> str:
+    """
+    Give record on line n the jobfile it will be written to, unless
+    an earlier record has it. claimed maps jobfiles to lines. Returns
+    the error, or None.
+    """
+    job = types.SimpleNamespace(username=dialog.username.answer,
+        jobname=str(record.get('jobname') or "").strip())
+    jobfile = os.path.abspath(str(record.get('jobfile') or "").strip() or
+        dialog.jobfile.default(job))
+    if jobfile in claimed:
+        return f"jobfile: {jobfile} is also the jobfile of line {claimed[jobfile]}."
+    claimed[jobfile] = n
+    return None
+
+
+def unique_jobfiles(records:Iterable[Tuple[int, dict, str]]) -> Tuple[int, dict, str]:
+    """
+    Let only the first record that names a jobfile have it. Two jobs
+    written to the same file would race when there are workers, and
+    one would quietly replace the other when there are not. Records
+    that do not name a jobfile get the one the dialog would give them.
+    """
+    claimed = {}
+    for n, record, error in records:
+        if not error: error = claim_jobfile(claimed, n, record)
+        yield n, record, error
+
+
+def with_partition(record:dict) -> dict:
+    """
+    If the record does not name a partition, recommend one for the
+    resources it asks for.
+    """
+    if record is None or record.get('partition') not in (None, ""): return record
+    return {**record, 'partition':rules.recommended_partition(
+        record.get('mem'), record.get('cores'), record.get('time'))}
+
 
+def write_jobfile(t:JobSpec, jobfile:str) -> str:
+    """
+    Render the job, and write it, timing each separately. The file
+    is replaced all at once. Returns 'created' or 'updated'.
+    """
+    with timings.timer('render'):
+        text = TEMPLATE.render(t)
+    with timings.timer('write'):
+        existed = os.path.exists(jobfile)
+        utils.atomic_write(jobfile, text)
+    return 'updated' if existed else 'created'
 
-def review_answers(t:SloppyTree) -> bool:
+
+def write_profile(filename:str) -> None:
+    """
+    Write the timings as one line of JSON, to stderr if filename is
+    "-". Otherwise the line is appended, so that one file can collect
+    the runs from every login node.
+    """
+    line = json.dumps(timings.report(started, version=VERSION, rules_version=rules.VERSION))
+    if filename == '-':
+        print(line, file=sys.stderr)
+        return
+    with open(filename, 'a') as f:
+        f.write(line + "\n")
+
+
+def write_record(item:Tuple[int, dict, str]) -> dict:
+    """
+    Check one record from utils.read_manifest, and write its job
+    if it is correct, and not the same as it was the last time. The
+    error, if there is one, may be a list of them. An item from
+    screen_records has a fourth part, the fields already checked.
+    Returns the record's line in the report, and the job's digest.
+    """
+    n, record, error, *checked = item
+    errors, jobfile, status, digest = [], None, None, None
+    try:
+        job, errors = ((None, error if isinstance(error, list) else [error]) if error
+            else get_record_answers(dialog, record, checked=checked[0] if checked else ()))
+        jobfile = (job.jobfile if job else (record or {}).get('jobfile')) or None
+        if job is not None:
+            digest = job_digest(job)
+            if WRITTEN_BEFORE.get(digest) == jobfile and os.path.exists(jobfile):
+                status = 'unchanged'
+            else:
+                status = write_jobfile(job, jobfile)
+
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+    return {"line":n, "jobfile":jobfile, "ok":status is not None, "errors":errors, "status":status,
+        "digest":digest}
+
+
+def read_script(t:SloppyTree, f:BinaryIO=None) -> Tuple[int, dict, dict, str]:
+    """
+    A generator of the jobs in a script: one answer to each question
+    in t, a line apiece and in the order they are asked, then the
+    next job. utils.script_answers does the reading.
+
+    yields -- (line of the job's first answer, the answers keyed by
+        question, the line of each answer, None), or a description
+        of the problem in place of None if the script ends partway
+        through the job.
+    """
+    questions = [ _ for _ in t.keys() if 'prompt' in t[_] ]
+    for answers in utils.batches(utils.script_answers(f), len(questions)):
+        lines = { k : n for k, (n, x) in zip(questions, answers) }
+        record = { k : x for k, (n, x) in zip(questions, answers) }
+        error = None if len(answers) == len(questions) else (
+            f"the script ends after {len(answers)} of the {len(questions)} answers to this job.")
+        yield answers[0][0], record, lines, error
+
+
+def review_answers(t:SloppyTree, job:JobSpec) -> bool:
     print("\n" + 80*"=" + "\n")
     for k in t.keys():
         if "prompt" in t[k]:
-            print(f"\t{t[k].prompt()} => {t[k].answer}")
+            print(f"\t{t[k].prompt()} => {getattr(job, k)}")
 
     return truthy(input("\nThese are the answers you provided. Are they OK? [y] : "))
     
 
+@trap
+def scripted_main(myargs:argparse.Namespace) -> int:
+    """
+    Write a job for each set of answers in the script on stdin. The
+    jobs are checked and written a batch at a time, as the script is
+    read. A job with mistakes is skipped, and the mistakes are
+    written to stderr with the lines where they are.
+    """
+    counts = collections.Counter()
+    jobfiles = []
+
+    for batch in utils.batches(read_script(dialog), 256):
+        for n, record, lines, error in batch:
+            try:
+                job, errors = (None, [f"line {n}: {error}"]) if error else get_record_answers(dialog, record, lines)
+                if job is not None:
+                    counts[write_jobfile(job, job.jobfile)] += 1
+                    jobfiles.append(job.jobfile)
+            except Exception as e:
+                job, errors = None, [f"line {n}: {type(e).__name__}: {e}"]
+
+            if job is None:
+                counts['failed'] += 1
+                for e in errors: print(e, file=sys.stderr)
+
+    if not sum(counts.values()):
+        print("There are no answers in the script.", file=sys.stderr)
+        return os.EX_NOINPUT
+
+    print(f"{counts['created']} jobs created, {counts['updated']} updated, "
+        f"{counts['failed']} with errors.", file=sys.stderr)
+    if myargs.submit and not submit_jobs(jobfiles, myargs): counts['failed'] += 1
+    return os.EX_OK if not counts['failed'] else os.EX_DATAERR
+
+
 def scrub_input(prompt_text:str) -> str:
     """
     Like input, but ditches everything after the octothorpe.
@@ -217,29 +654,30 @@ def slurmwriter_main(myargs:argparse.Namespace) -> int:
         print(f"      rules. Version of {rules.VERSION}")
         print(__doc__)
 
+    rules.warm(myargs.refresh_cluster)
+
     if myargs.debug:
-        partition_names = tuple(partitions.keys())
-        program_names = tuple(programs.keys())
+        startup = time.perf_counter() - started
+        print(f"Startup took {startup*1000:.1f} ms; the budget is {STARTUP_BUDGET*1000:.0f} ms.")
+        if startup > STARTUP_BUDGET: print("That is over budget.")
+        partition_names = tuple(partitions().keys())
+        software = rules.find_software()
         print(f"{partition_names=}\n")
-        print(f"{program_names=}\n")
+        print(f"{len(software.executables)} programs in the PATH, {len(software.modules)} with module files.\n")
         print("\n")
 
-    while True:
+    if not INTERACTIVE: return scripted_main(myargs)
 
-        info = SloppyTree()
-        info = get_answers(dialog, myargs)
-        if INTERACTIVE and not review_answers(info): 
-            print("OK. Try again.")
-            sys.exit(os.EX_DATAERR)
+    info = get_answers(dialog, myargs)
+    if not review_answers(dialog, info): 
+        print("OK. Try again.")
+        sys.exit(os.EX_DATAERR)
 
-        
-        INTERACTIVE and print(f"Writing file {info.jobfile.answer}  ...")
-        code = slurmscript(info)
-        with open(info.jobfile.answer, 'w+') as f:
-            f.write(code)
-
-        if INTERACTIVE: break
+    print(f"Writing file {info.jobfile}  ...")
+    write_jobfile(info, info.jobfile)
 
+    if myargs.submit and not submit_jobs([info.jobfile], myargs): 
+        return os.EX_UNAVAILABLE
     return os.EX_OK
 
 
@@ -249,11 +687,50 @@ if __name__ == '__main__':
         description="A program to help newbies write SLURM jobs on Spydur.")
 
     parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--force', action='store_true',
+        help="With --manifest, write every job, even those that have not changed since the last run.")
+    parser.add_argument('--jobids', type=str, default="",
+        help="Where --submit records the job IDs. The default is slurmwriter.jobids")
+    parser.add_argument('--jobs', type=int, default=1,
+        help="Number of processes to use for --manifest.")
+    parser.add_argument('--manifest', type=str, default="",
+        help="A .jsonl or .csv file with one job per line, keyed by the names of the questions.")
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default="",
+        help="Write the time spent in each phase as JSON, to stderr or appended to the named file.")
+    parser.add_argument('--profile-dump', type=str, default="",
+        help="Also run under cProfile, and write the statistics to this file.")
+    parser.add_argument('--refresh-cluster', action='store_true',
+        help="Query SLURM for the partitions rather than using the cached copy.")
+    parser.add_argument('--template', type=str, default='site', choices=sorted(templates),
+        help="The kind of job to write.")
+    parser.add_argument('--submit', action='store_true',
+        help="Submit the jobs with sbatch after they are written.")
+    parser.add_argument('--sweep', type=str, default="",
+        help="A JSON file describing a parameter sweep to write as one job array.")
+    parser.add_argument('--report', type=str, default="",
+        help="Where to write the results of --manifest. The default is the manifest's name plus .report")
 
     myargs = parser.parse_args()
+    TEMPLATE = templates[myargs.template]
+
+    if myargs.profile_dump:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     try:
-        sys.exit(slurmwriter_main(myargs))
+        if myargs.manifest:
+            sys.exit(manifest_main(myargs))
+        elif myargs.sweep:
+            sys.exit(sweep_main(myargs))
+        else:
+            sys.exit(slurmwriter_main(myargs))
     except KeyboardInterrupt as e:
         print("You have asked to exit via control-C")
         sys.exit(os.EX_OK)
+    finally:
+        if myargs.profile_dump:
+            profiler.disable()
+            profiler.dump_stats(myargs.profile_dump)
+        if myargs.profile:
+            write_profile(myargs.profile)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Submit jobfiles to SLURM without flooding the controller. A few
+workers share a budget of submissions per second, and when sbatch
+says the controller is too busy, the worker waits longer each time
+before it tries again. The job ID of each submission is recorded,
+one JSON line per jobfile.
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import concurrent.futures
+import getpass
+import json
+import math
+import os
+import random
+import threading
+import time
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# Parts of this project.
+###
+
+from   sloppytree import SloppyTree
+import utils
+
+###
+# What sbatch says when the controller is busy, rather than when
+# something is wrong with the job. These are worth trying again.
+###
+busy_signals = ('Resource temporarily unavailable',
+    'Slurm temporarily unable', 'Unable to contact slurm controller')
+
+###
+# When sbatch times out, the controller may have queued the job
+# before the answer was lost. These are not tried again.
+###
+timeout_signals = ('Socket timed out', 'time limit')
+
+
+class RateLimit:
+    """
+    A token bucket shared by the workers: no more than rate
+    submissions per second, with bursts of at most one second's worth.
+    """
+
+    def __init__(self, rate:float):
+        self.rate = rate
+        self.tokens = 1.0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def wait(self) -> None:
+        """
+        Return when it is our turn to submit.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def queued_jobid(jobfile:str) -> str:
+    """
+    The ID of the user's queued job whose script is jobfile, or ""
+    if there is none, or squeue does not answer.
+    """
+    try:
+        code, out, err = utils.dorunrun(['squeue', '--noheader', '-u', getpass.getuser(),
+            '--format=%i|%o'], timeout=30, return_datatype=tuple)
+    except Exception as e:
+        return ""
+
+    jobfile = os.path.abspath(jobfile)
+    for line in out.splitlines() if code == 0 else ():
+        jobid, _, command = line.strip().partition('|')
+        if command == jobfile: return jobid
+    return ""
+
+
+def submit_one(jobfile:str,
+    params:SloppyTree,
+    limit:RateLimit) -> dict:
+    """
+    Submit one jobfile, and try again with exponential backoff if
+    the controller is busy. If sbatch times out, the job is looked
+    for in the queue rather than submitted again, which might run it
+    twice. Returns the line for the results file.
+    """
+    delay = params.submit.backoff
+    for attempt in range(params.submit.retries + 1):
+        limit.wait()
+        try:
+            code, out, err = utils.dorunrun([params.submit.exe(), '--parsable', jobfile],
+                timeout=params.submit.timeout, return_datatype=tuple)
+        except Exception as e:
+            code, out, err = -1, "", str(e)
+
+        if code == 0:
+            return {"jobfile":jobfile, "ok":True, "jobid":out.strip().split(';')[0],
+                "attempts":attempt+1}
+
+        if any(_ in err for _ in timeout_signals):
+            jobid = queued_jobid(jobfile)
+            if jobid:
+                return {"jobfile":jobfile, "ok":True, "jobid":jobid, "attempts":attempt+1}
+            err = f"{err.strip()} It may have been submitted anyway; see squeue."
+            break
+
+        if not any(_ in err for _ in busy_signals):
+            break
+
+        # Jitter keeps the workers from all coming back at once.
+        time.sleep(delay * random.uniform(0.5, 1.5))
+        delay = min(delay*2, params.submit.max_backoff)
+
+    return {"jobfile":jobfile, "ok":False, "error":err.strip(), "attempts":attempt+1}
+
+
+def submit_all(jobfiles:Iterable[str],
+    params:SloppyTree,
+    results_file:str) -> Tuple[int, int]:
+    """
+    Submit the jobfiles with params.submit.workers workers, at no more
+    than params.submit.rate per second, and write the results in the
+    order of jobfiles. Returns the number submitted, and the number
+    that were not.
+    """
+    params.submit.exe()
+    limit = RateLimit(params.submit.rate)
+    submitted = failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=params.submit.workers) as pool, \
+        open(results_file, 'a') as results:
+        for batch in utils.batches(jobfiles, 64 * params.submit.workers):
+            for result in pool.map(lambda _ : submit_one(_, params, limit), batch):
+                if result['ok']:
+                    submitted += 1
+                else:
+                    failed += 1
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+
+    return submitted, failed
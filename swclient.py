@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+The thin client for swdaemon. It sends each line of a manifest
+(JSON lines) to the user's daemon, starting the daemon if it is
+not running. The replies are the report, and the jobs that were
+written are kept in the state file, as they are by slurmwriter.py
+--manifest. It imports nothing from the rest of slurmwriter, so that
+it starts quickly.
+
+    python swclient.py jobs.jsonl [--template site] [--validate]
+"""
+
+import os
+import sys
+import argparse
+import getpass
+import json
+import socket
+import subprocess
+import tempfile
+import time
+
+###
+# This must agree with params.daemon.socket in rules.py.
+###
+default_socket = os.path.join(os.getenv('SLURMWRITER_CACHE', '/dev/shm/slurmwriter'),
+    getpass.getuser(), "daemon.sock")
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def connect(path:str, wait:float=10) -> socket.socket:
+    """
+    Connect to the daemon, starting it if need be.
+    """
+    started = False
+    deadline = time.monotonic() + wait
+    while True:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(path)
+            return s
+        except OSError as e:
+            s.close()
+            if time.monotonic() > deadline: raise
+
+        if not started:
+            subprocess.Popen([sys.executable, os.path.join(here, 'swdaemon.py'), '--socket', path],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True, cwd='/')
+            started = True
+        time.sleep(0.05)
+
+
+def swclient_main(myargs:argparse.Namespace) -> int:
+    try:
+        s = connect(myargs.socket)
+    except OSError as e:
+        print(f"Cannot reach the slurmwriter daemon at {myargs.socket}: {e}", file=sys.stderr)
+        return os.EX_UNAVAILABLE
+
+    op = json.dumps('validate' if myargs.validate else 'render')
+    template = json.dumps(myargs.template)
+    cwd = json.dumps(os.getcwd())
+    from_stdin = myargs.manifest == '-'
+    report_name = "-" if from_stdin else f"{myargs.manifest}.report"
+    state_name = None if from_stdin or myargs.validate else os.path.abspath(f"{myargs.manifest}.state")
+    state = json.dumps(state_name)
+    counts = dict.fromkeys(('created', 'updated', 'unchanged', 'checked', 'failed'), 0)
+    new_state = {}
+
+    f = sys.stdin if from_stdin else open(myargs.manifest)
+    report = sys.stdout if from_stdin else open(report_name, 'w')
+    with s, s.makefile('rwb') as daemon, f, report:
+        for n, line in enumerate(f, start=1):
+            if not line.strip(): continue
+            # The line goes to the daemon as it is; the daemon parses it.
+            daemon.write((f'{{"op":{op}, "template":{template}, "line":{n}, '
+                f'"cwd":{cwd}, "state":{state}, "record":{line.strip()}}}\n').encode('utf-8'))
+            daemon.flush()
+            reply = daemon.readline().decode('utf-8')
+            if not reply: 
+                print("The daemon went away.", file=sys.stderr)
+                return os.EX_UNAVAILABLE
+
+            reply = json.loads(reply)
+            reply.setdefault('line', n)
+            digest = reply.pop('digest', None)
+            if not reply['ok']:
+                counts['failed'] += 1
+            else:
+                counts[reply.get('status') or 'checked'] += 1
+                if digest: new_state[digest] = reply['jobfile']
+            report.write(json.dumps(reply) + "\n")
+
+    if state_name:
+        fd, tempname = tempfile.mkstemp(dir=os.path.dirname(state_name), prefix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(new_state, f)
+        os.chmod(tempname, 0o644)
+        os.replace(tempname, state_name)
+
+    if myargs.validate:
+        print(f"{counts['checked']} jobs checked, {counts['failed']} records with errors.", file=sys.stderr)
+    else:
+        print(f"{counts['created']} jobs created, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged, {counts['failed']} records with errors. See {report_name}",
+            file=sys.stderr)
+    return os.EX_OK if not counts['failed'] else os.EX_DATAERR
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="swclient",
+        description="Write the jobs in a manifest with the resident slurmwriter daemon.")
+
+    parser.add_argument('manifest', type=str, help="A .jsonl file with one job per line, or - for stdin.")
+    parser.add_argument('--socket', type=str, default=default_socket)
+    parser.add_argument('--template', type=str, default='site', choices=('gpu', 'site'))
+    parser.add_argument('--validate', action='store_true', 
+        help="Only check the jobs; do not write them.")
+
+    myargs = parser.parse_args()
+    sys.exit(swclient_main(myargs))
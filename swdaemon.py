@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+A resident slurmwriter that keeps the partitions, the module index,
+and the user's groups in memory, and answers requests on a Unix
+domain socket. swclient.py is the other end. Each user has their
+own daemon, because the jobs it writes belong to the user and the
+accounts it accepts are the user's.
+
+Each request is one line of JSON, and so is each reply:
+
+    {"op":"ping"}                               -> {"ok":true, "pid":...}
+    {"op":"validate", "record":{...}}           -> {"ok":..., "errors":[...]}
+    {"op":"render", "record":{...},
+        "template":"site", "line":n,
+        "cwd":..., "state":...}                 -> {"ok":..., "errors":[...],
+                                                    "jobfile":..., "status":...,
+                                                    "digest":..., "line":n}
+    {"op":"reload"}                             -> {"ok":true}
+
+The records are those of a manifest. Relative names in them are
+relative to cwd, the client's directory. state is the name of the
+manifest's .state file, as slurmwriter.py --manifest keeps it; a job
+whose digest is there, and whose file is still there, is not written
+again. As in a manifest, a record may not have the jobfile of an
+earlier record on the same connection. Anything else in a request is
+refused, rather than ignored.
+When rules.py or script.py is changed, the daemon reloads them before
+the next request.
+"""
+
+import typing
+from   typing import *
+
+min_py = (3, 8)
+
+###
+# Standard imports.
+###
+
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+import argparse
+import fcntl
+import importlib
+import json
+import math
+import socket
+import socketserver
+import types
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# Parts of this project.
+###
+
+from   gkfdecorators import trap
+import rules
+import script
+import slurmwriter
+import utils
+
+watched = {}
+states = {}
+known = frozenset(('op', 'record', 'template', 'line', 'cwd', 'state'))
+
+def daemon_running(path:str) -> bool:
+    """
+    Whether something is listening on the socket at path.
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError as e:
+        return False
+    finally:
+        s.close()
+
+
+def reload_if_changed(force:bool=False) -> bool:
+    """
+    Reload the parts of the program if any of their files have
+    changed. rules and script are reloaded before slurmwriter,
+    which imports names from them. Returns True if they were.
+    """
+    mtimes = { m.__file__ : os.stat(m.__file__).st_mtime for m in (rules, script, slurmwriter) }
+    changed = force or bool(watched) and mtimes != watched
+    watched.update(mtimes)
+
+    if changed:
+        importlib.reload(rules)
+        importlib.reload(script)
+        importlib.reload(slurmwriter)
+        warm()
+
+    return changed
+
+
+def respond(request:dict, claimed:dict=None) -> dict:
+    """
+    Do what one request asks. claimed maps the jobfiles of the
+    connection's earlier records to their lines.
+    """
+    op = request.get('op')
+    if op == 'ping':
+        return {"ok":True, "pid":os.getpid()}
+
+    if op == 'reload':
+        reload_if_changed(force=True)
+        return {"ok":True}
+
+    if op not in ('validate', 'render'):
+        return {"ok":False, "errors":[f"{op} is not something I know how to do."]}
+
+    unknown = sorted(set(request) - known)
+    if unknown:
+        return {"ok":False, "errors":[f"The daemon cannot honor {', '.join(unknown)}; "
+            "use slurmwriter.py --manifest."]}
+
+    record = request.get('record')
+    if not isinstance(record, dict):
+        return {"ok":False, "errors":["The record is missing, or is not a JSON object."]}
+
+    # The daemon was started from some other directory.
+    if request.get('cwd'): os.chdir(request['cwd'])
+
+    error = slurmwriter.claim_jobfile({} if claimed is None else claimed,
+        request.get('line'), record)
+    if error: return {"ok":False, "errors":[error]}
+
+    job, errors = slurmwriter.get_record_answers(rules.dialog, slurmwriter.with_partition(record))
+    if job is None or op == 'validate':
+        return {"ok":job is not None, "errors":errors}
+
+    template = script.templates.get(request.get('template', 'site'))
+    if template is None:
+        return {"ok":False, "errors":[f"There is no template named {request.get('template')}."]}
+
+    digest = slurmwriter.job_digest(job, template)
+    if written_before(request.get('state')).get(digest) == job.jobfile and os.path.exists(job.jobfile):
+        status = 'unchanged'
+    else:
+        status = 'updated' if os.path.exists(job.jobfile) else 'created'
+        utils.atomic_write(job.jobfile, template.render(job))
+        rules.program_jobfile(types.SimpleNamespace(jobfile=job.jobfile))
+    return {"ok":True, "errors":[], "jobfile":job.jobfile, "status":status, "digest":digest}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Read requests from the connection until the client closes it.
+    """
+    def handle(self) -> None:
+        claimed = {}
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                reload_if_changed()
+                reply = respond(request, claimed)
+            except Exception as e:
+                request = {}
+                reply = {"ok":False, "errors":[f"{type(e).__name__}: {e}"]}
+
+            if 'line' in request: reply['line'] = request['line']
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+
+
+def written_before(state_name:str) -> dict:
+    """
+    The digests in a manifest's .state file, read again only when
+    the file changes.
+    """
+    if not state_name: return {}
+    try:
+        mtime = os.stat(state_name).st_mtime
+    except OSError as e:
+        return {}
+    if states.get(state_name, (None,))[0] != mtime:
+        states[state_name] = mtime, utils.read_tree(state_name) or {}
+    return states[state_name][1]
+
+
+def warm() -> None:
+    """
+    Find out everything the requests will need, now, rather than
+    during the first request.
+    """
+    # The recent file is written when a job is, not when one is checked.
+    rules.dialog.jobfile.foo = rules.NOP
+    rules.warm()
+    rules.partitions()
+    rules.account_groups()
+    rules.module_files()
+    rules.module_trie()
+
+
+@trap
+def swdaemon_main(myargs:argparse.Namespace) -> int:
+    utils.make_cache_dir(os.path.dirname(myargs.socket))
+
+    ###
+    # Only one daemon per socket. The one that holds the lock owns
+    # the socket, and a socket that nobody answers on is left over
+    # from one that died.
+    ###
+    lockfd = os.open(f"{myargs.socket}.lock", os.O_RDONLY | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError as e:
+        return os.EX_OK
+    if daemon_running(myargs.socket): return os.EX_OK
+    try:
+        os.unlink(myargs.socket)
+    except FileNotFoundError as e:
+        pass
+
+    old_umask = os.umask(0o077)
+    server = socketserver.UnixStreamServer(myargs.socket, RequestHandler)
+    os.umask(old_umask)
+
+    # The daemon goes away by itself when nobody has used it for a while.
+    idle = False
+    def handle_timeout() -> None:
+        nonlocal idle
+        idle = True
+    server.timeout = myargs.idle
+    server.handle_timeout = handle_timeout
+
+    try:
+        # Clients can connect while we warm up; they wait for their replies.
+        reload_if_changed()
+        warm()
+        while not idle:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.unlink(myargs.socket)
+        os.close(lockfd)
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="swdaemon",
+        description="Keep slurmwriter in memory, and write jobs on request.")
+
+    parser.add_argument('--idle', type=int, default=rules.params.daemon.idle,
+        help="Seconds without a request after which the daemon exits.")
+    parser.add_argument('--socket', type=str, default=rules.params.daemon.socket,
+        help="Name of the socket to listen on.")
+
+    myargs = parser.parse_args()
+    sys.exit(swdaemon_main(myargs))
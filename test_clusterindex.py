@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of writing and reading the shared cluster index.
+
+    python -m pytest test_clusterindex.py
+"""
+
+import pytest
+
+import clusterindex
+from   sloppytree import SloppyTree
+
+modules = [ ('samtools', '1.9', '/mf/samtools/1.9'), ('samtools', '1.10', '/mf/samtools/1.10'),
+    ('gatk', '4.1', '/mf/gatk/4.1'), ('bio/bwa', '0.7', '/mf/bio/bwa/0.7'),
+    ('samtools', '1.9', '/mf/samtools/1.9') ]
+
+
+def cluster() -> SloppyTree:
+    t = SloppyTree()
+    t.basic.cores = 52
+    t.basic.ram = 384
+    t.basic.xtras = None
+    t.basic.gpus = None
+    t.basic.max_hours = 336.0
+    t.ML.cores = 24
+    t.ML.ram = 768
+    t.ML.xtras = "amd"
+    t.ML.gpus = "gpu:a40:8"
+    t.ML.max_hours = 72.5
+    t.default_partition = 'basic'
+    return t
+
+
+@pytest.fixture
+def index_file(tmp_path) -> str:
+    filename = str(tmp_path / "cluster.idx")
+    assert clusterindex.build_index(filename, modules, cluster()) == 4
+    return filename
+
+
+def test_round_trip_modules(index_file):
+    index = clusterindex.ClusterIndex(index_file)
+    assert sorted(index.modules()) == sorted(set(modules))
+    index.close()
+
+
+def test_round_trip_partitions(index_file):
+    index = clusterindex.ClusterIndex(index_file)
+    assert index.partitions() == cluster()
+    index.close()
+
+
+def test_checksum(index_file):
+    with open(index_file, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xff]))
+
+    with pytest.raises(ValueError, match="checksum"):
+        clusterindex.ClusterIndex(index_file)
+    assert clusterindex.open_index(index_file, 3600) is None
+
+
+def test_not_an_index(tmp_path):
+    filename = tmp_path / "cluster.idx"
+    filename.write_bytes(b"not an index" * 10)
+    with pytest.raises(ValueError):
+        clusterindex.ClusterIndex(str(filename))
+    assert clusterindex.open_index(str(filename), 3600) is None
+    assert clusterindex.open_index(str(tmp_path / "missing.idx"), 3600) is None
+
+
+def test_too_old(index_file):
+    assert clusterindex.open_index(index_file, -1) is None
+    index = clusterindex.open_index(index_file, 3600)
+    assert index is not None
+    index.close()
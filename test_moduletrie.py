@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of resolving a program's name to exactly one module.
+
+    python -m pytest test_moduletrie.py
+"""
+
+import moduletrie
+
+modules = { 'samtools':['1.9', '1.10'], 'gatk':['4.2.0.0', '4.1'],
+    'gatk-legacy':['3'], 'bio/bwa':['0.7'], 'plain':[''] }
+
+trie = moduletrie.ModuleTrie(modules, {'samtools':'1.9'})
+
+
+def test_resolve_name():
+    # The site's default, or else the latest.
+    assert trie.resolve('samtools') == (('samtools', '1.9'),)
+    assert trie.resolve('gatk') == (('gatk', '4.2.0.0'),)
+    assert trie.resolve('plain') == (('plain', ''),)
+
+
+def test_resolve_version():
+    assert trie.resolve('samtools/1.10') == (('samtools', '1.10'),)
+    assert trie.resolve('gatk-4.1') == (('gatk', '4.1'),)
+    assert trie.resolve('bio/bwa/0.7') == (('bio/bwa', '0.7'),)
+
+
+def test_resolve_name_with_a_separator():
+    # gatk-legacy is a name, not gatk version "legacy".
+    assert trie.resolve('gatk-legacy') == (('gatk-legacy', '3'),)
+
+
+def test_resolve_start_of_a_name():
+    assert trie.resolve('sam') == (('samtools', '1.9'),)
+    assert trie.resolve('sam', complete=False) == ()
+    assert trie.resolve('ga') == (('gatk', '4.2.0.0'), ('gatk-legacy', '3'))
+
+
+def test_resolve_start_of_a_version():
+    assert trie.resolve('samtools/1') == (('samtools', '1.9'), ('samtools', '1.10'))
+
+
+def test_resolve_nothing():
+    assert trie.resolve('nosuch') == ()
+    assert trie.resolve('samtools/2') == ()
+    assert trie.resolve('') == ()
+
+
+def test_candidates():
+    assert trie.candidates('gat') == ['gatk', 'gatk-legacy']
+    assert trie.candidates('x') == []
+
+
+def test_version_key():
+    assert sorted(['1.10', '1.9', '1.9a', '2'], key=moduletrie.version_key) == ['1.9', '1.9a', '1.10', '2']
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the shape of the scripts the templates write.
+
+    python -m pytest test_script.py
+"""
+
+import typing
+from   typing import *
+
+import pytest
+
+import script
+from   sloppytree import SloppyTree
+
+
+def info() -> SloppyTree:
+    t = SloppyTree()
+    for k in ('username', 'jobname', 'account', 'start', 'mem', 'cores',
+        'partition', 'time', 'program', 'inputfile'):
+        t[k].answer = k
+    t.written.foo = lambda : "2021-01-01 00:00:00"
+    t.modules = "module load samtools/1.9"
+    t.joblines = "samtools x.bam"
+    t.comment = "slurmwriter samtools"
+    t.array.size = 4
+    t.array.range = "1-4"
+    t.array.table = "fit.params"
+    return t
+
+
+def directives_after_commands(text:str) -> List[str]:
+    """
+    The #SBATCH lines that sbatch will not read, because a command
+    comes before them.
+    """
+    late = []
+    started = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#SBATCH'):
+            if started: late.append(line)
+        elif line and not line.startswith('#'):
+            started = True
+    return late
+
+
+@pytest.mark.parametrize('template', [ script.templates['site'], script.templates['gpu'], script.array_job ],
+    ids=['site', 'gpu', 'array'])
+def test_directives_come_first(template):
+    text = template.render(info())
+    assert '#SBATCH' in text
+    assert directives_after_commands(text) == []
+
+
+def test_array_directives():
+    text = script.array_job.render(info())
+    assert '#SBATCH --array=1-4' in text
+    assert '#SBATCH -o "%x.%A_%a.out"' in text
+
+
+def test_no_shell_variables_in_directives():
+    for template in (script.templates['site'], script.templates['gpu'], script.array_job):
+        for line in template.render(info()).splitlines():
+            if line.startswith('#SBATCH'): assert '$' not in line, line
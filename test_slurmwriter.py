@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the hash that decides whether a job in a manifest must be
+written again, and of what a manifest refuses.
+
+    python -m pytest test_slurmwriter.py
+"""
+
+import typing
+from   typing import *
+
+import argparse
+import json
+import os
+
+import pytest
+
+from   jobspec import JobSpec
+import rules
+import script
+from   sloppytree import SloppyTree
+import slurmwriter
+
+answers = dict(username='alice', jobname='fit', program='samtools', inputfile='a.bam',
+    partition='basic', account='alice', mem=16, cores=8, time=1, start='now',
+    jobfile='/home/alice/fit.slurm', modules='module load samtools/1.9',
+    joblines='samtools a.bam', comment='slurmwriter samtools', written='2021-06-30 14:00:00')
+
+
+def test_same_job_same_digest():
+    assert slurmwriter.job_digest(JobSpec(**answers)) == slurmwriter.job_digest(JobSpec(**answers))
+
+
+def test_when_written_does_not_count():
+    later = JobSpec(**{**answers, 'written':'2021-07-01 09:00:00'})
+    assert slurmwriter.job_digest(later) == slurmwriter.job_digest(JobSpec(**answers))
+
+
+def test_defaults_count():
+    # A record that leaves out mem gets whatever the default is at the
+    # time, so the digest must change when the default does.
+    for k, v in (('mem', 32), ('partition', 'medium'), ('modules', 'module load samtools/1.10')):
+        changed = JobSpec(**{**answers, k:v})
+        assert slurmwriter.job_digest(changed) != slurmwriter.job_digest(JobSpec(**answers)), k
+
+
+def test_template_counts():
+    job = JobSpec(**answers)
+    assert slurmwriter.job_digest(job) == slurmwriter.job_digest(job, script.templates['site'])
+    assert slurmwriter.job_digest(job, script.templates['gpu']) != slurmwriter.job_digest(job)
+
+
+def cluster() -> SloppyTree:
+    t = SloppyTree()
+    t.basic.cores = 52
+    t.basic.ram = 384
+    t.basic.xtras = None
+    t.basic.gpus = None
+    t.basic.max_hours = 336.0
+    t.default_partition = 'basic'
+    return t
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch) -> Callable:
+    """
+    Run --manifest on some records against a made-up cluster, without
+    asking SLURM, and return the report.
+    """
+    monkeypatch.setattr(rules, '_partitions', cluster())
+    monkeypatch.setattr(rules, 'warm', lambda refresh=False : None)
+    for k in ('written', 'jobfile'):
+        monkeypatch.setattr(rules.dialog[k], 'foo', rules.dialog[k].foo)
+
+    def run(*records:dict) -> List[dict]:
+        filename = tmp_path / "jobs.jsonl"
+        filename.write_text("".join(json.dumps(_) + "\n" for _ in records))
+        myargs = argparse.Namespace(manifest=str(filename), report="", force=False,
+            refresh_cluster=False, jobs=1, submit=False)
+        slurmwriter.manifest_main(myargs)
+        with open(f"{filename}.report") as f:
+            return [ json.loads(_) for _ in f ]
+
+    return run
+
+
+def test_manifest_refuses_a_bad_start(tmp_path, manifest):
+    good = {"jobname":"good", "program":"ls", "partition":"basic", "start":"now", 
+        "jobfile":str(tmp_path / "good.slurm")}
+    bad = {**good, "jobname":"bad", "start":"garbage!!", "jobfile":str(tmp_path / "bad.slurm")}
+
+    report = manifest(good, bad)
+    assert report[0]['ok'] and os.path.exists(good['jobfile'])
+    assert not report[1]['ok'] and not os.path.exists(bad['jobfile'])
+    assert report[1]['errors'] == ["start: 'garbage!!' is not acceptable."]
+
+
+def test_checked_fields_are_not_checked_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, '_partitions', cluster())
+    monkeypatch.setattr(rules.dialog.jobfile, 'foo', rules.NOP)
+    record = {"jobname":"big", "program":"ls", "partition":"basic", "mem":1000, "start":"now",
+        "jobfile":str(tmp_path / "big.slurm")}
+    job, errors = slurmwriter.get_record_answers(rules.dialog, record)
+    assert job is None and errors[0].startswith("mem: ")
+    job, errors = slurmwriter.get_record_answers(rules.dialog, record, checked={'mem'})
+    assert job.mem == 1000 and errors == []
+
+
+def test_screen_records(monkeypatch):
+    # What batchcheck would say, without NumPy.
+    monkeypatch.setattr(slurmwriter.batchcheck, 'PartitionLimits', lambda partitions, limits : None)
+    monkeypatch.setattr(slurmwriter.batchcheck, 'check_records', lambda limits, records, dialog :
+        ([ r['mem'] <= 384 for r in records ], [ [] for r in records ]))
+    monkeypatch.setattr(rules, '_partitions', cluster())
+    good = {"jobname":"good", "program":"ls", "partition":"basic", "mem":16, "cores":4}
+    bad = {**good, "jobname":"bad", "mem":1000}
+    screened = list(slurmwriter.screen_records([(1, good, None), (2, bad, None), (3, None, "unreadable")]))
+    assert screened == [ (1, good, None, frozenset(('partition', 'mem', 'cores'))),
+        (2, bad, None, frozenset()), (3, None, "unreadable", frozenset()) ]
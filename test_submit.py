@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the pacing and retries of submissions.
+
+    python -m pytest test_submit.py
+"""
+
+import threading
+import time
+
+from   sloppytree import SloppyTree
+import submit
+import utils
+
+
+def test_rate_limit_first_is_free():
+    limit = submit.RateLimit(1)
+    started = time.monotonic()
+    limit.wait()
+    assert time.monotonic() - started < 0.1
+
+
+def test_rate_limit_paces():
+    limit = submit.RateLimit(50)
+    started = time.monotonic()
+    for i in range(11):
+        limit.wait()
+    # One at once, and ten more at 50 a second.
+    assert 0.18 <= time.monotonic() - started < 0.5
+
+
+def test_rate_limit_is_shared():
+    limit = submit.RateLimit(50)
+    started = time.monotonic()
+    threads = [ threading.Thread(target=lambda : [ limit.wait() for i in range(5) ]) for j in range(4) ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert 0.36 <= time.monotonic() - started < 1
+
+
+def params() -> SloppyTree:
+    p = SloppyTree()
+    p.submit.exe = lambda : 'sbatch'
+    p.submit.retries = 3
+    p.submit.backoff = 0.001
+    p.submit.max_backoff = 0.001
+    p.submit.timeout = 1
+    return p
+
+
+def test_submit_retries_when_busy(monkeypatch):
+    answers = iter([ (1, "", "Resource temporarily unavailable"), (0, "1234;spydur\n", "") ])
+    monkeypatch.setattr(utils, 'dorunrun', lambda *args, **kwargs : next(answers))
+    assert submit.submit_one("a.slurm", params(), submit.RateLimit(1000)) == {
+        "jobfile":"a.slurm", "ok":True, "jobid":"1234", "attempts":2 }
+
+
+def test_submit_does_not_retry_after_a_timeout(monkeypatch):
+    calls = []
+    def dorunrun(command, **kwargs) -> tuple:
+        calls.append(command[0])
+        if command[0] == 'squeue': return 0, "", ""
+        return 1, "", "Socket timed out on send/recv operation"
+    monkeypatch.setattr(utils, 'dorunrun', dorunrun)
+
+    result = submit.submit_one("a.slurm", params(), submit.RateLimit(1000))
+    assert not result['ok'] and result['attempts'] == 1
+    assert calls == ['sbatch', 'squeue']
+
+
+def test_submit_finds_a_queued_job_after_a_timeout(monkeypatch, tmp_path):
+    jobfile = str(tmp_path / "a.slurm")
+    def dorunrun(command, **kwargs) -> tuple:
+        if command[0] == 'squeue': return 0, f"77|/elsewhere.slurm\n88|{jobfile}\n", ""
+        raise Exception("Process exceeded time limit at 1 seconds.")
+    monkeypatch.setattr(utils, 'dorunrun', dorunrun)
+
+    result = submit.submit_one(jobfile, params(), submit.RateLimit(1000))
+    assert result['ok'] and result['jobid'] == "88"
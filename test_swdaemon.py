@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of what the daemon does with the records of a manifest.
+
+    python -m pytest test_swdaemon.py
+"""
+
+import typing
+from   typing import *
+
+import os
+
+import pytest
+
+import rules
+from   sloppytree import SloppyTree
+import swdaemon
+
+
+def cluster() -> SloppyTree:
+    t = SloppyTree()
+    t.basic.cores = 52
+    t.basic.ram = 384
+    t.basic.xtras = None
+    t.basic.gpus = None
+    t.basic.max_hours = 336.0
+    t.default_partition = 'basic'
+    return t
+
+
+@pytest.fixture
+def recent(tmp_path, monkeypatch) -> List[str]:
+    """
+    Start the daemon's side against a made-up cluster, and return
+    the jobfiles it names as the most recent.
+    """
+    monkeypatch.setattr(rules, '_partitions', cluster())
+    monkeypatch.setattr(rules, 'warm', lambda refresh=False : None)
+    monkeypatch.setattr(rules.dialog.jobfile, 'foo', rules.dialog.jobfile.foo)
+    jobfiles = []
+    monkeypatch.setattr(rules, 'program_jobfile', lambda job : jobfiles.append(job.jobfile) or job)
+    monkeypatch.chdir(tmp_path)
+    swdaemon.warm()
+    return jobfiles
+
+
+def request(op:str, n:int, **record) -> dict:
+    record['jobfile'] = os.path.abspath(record['jobfile'])
+    return {"op":op, "line":n, "cwd":os.getcwd(),
+        "record":{"program":"ls", "partition":"basic", "start":"now", **record}}
+
+
+def test_validate_writes_nothing(recent):
+    reply = swdaemon.respond(request('validate', 1, jobname='a', jobfile='a.slurm'), {})
+    assert reply == {"ok":True, "errors":[]}
+    assert not os.path.exists('a.slurm') and recent == []
+
+
+def test_render_names_the_recent_job(recent):
+    reply = swdaemon.respond(request('render', 1, jobname='a', jobfile='a.slurm'), {})
+    assert reply['ok'] and reply['status'] == 'created'
+    assert recent == [os.path.abspath('a.slurm')]
+
+
+def test_one_jobfile_per_connection(recent):
+    claimed = {}
+    first = swdaemon.respond(request('render', 1, jobname='a', jobfile='a.slurm'), claimed)
+    second = swdaemon.respond(request('render', 2, jobname='b', jobfile='a.slurm'), claimed)
+    assert first['ok'] and not second['ok']
+    assert second['errors'] == [f"jobfile: {os.path.abspath('a.slurm')} is also the jobfile of line 1."]
+    with open('a.slurm') as f:
+        assert "JOBNAME=a\n" in f.read()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of reading sacct's output for the usage store.
+
+    python -m pytest test_usage.py
+"""
+
+import shlex
+import types
+
+from   jobspec import JobSpec
+import rules
+import script
+import usage
+
+sacct_text = """JobID|User|Comment|AllocCPUS|Elapsed|TotalCPU|MaxRSS|End|State
+101|alice|slurmwriter samtools|4|01:00:00|02:00:00||2021-06-30T14:00:00|COMPLETED
+101.batch|alice||4|01:00:00|02:00:00|2G|2021-06-30T14:00:00|COMPLETED
+101.0|alice||4|00:30:00|01:00:00|3145728K|2021-06-30T14:00:00|COMPLETED
+102|alice||1|1-00:00:00|12:00:00|512M|2021-06-30T15:00:00|TIMEOUT
+103|bob|slurmwriter gatk|2|00:10:00|00:00:00||2021-06-30T16:00:00|FAILED
+104|bob|slurmwriter gatk|2|00:00:00|00:00:00||Unknown|RUNNING
+"""
+
+
+def test_seconds():
+    assert usage.seconds("00:00:30") == 30
+    assert usage.seconds("01:02") == 62
+    assert usage.seconds("01:00:00.5") == 3600.5
+    assert usage.seconds("2-01:00:00") == 2*86400 + 3600
+    assert usage.seconds("") is None
+    assert usage.seconds("INVALID") is None
+
+
+def test_memory_gb():
+    assert usage.memory_gb("2G") == 2
+    assert usage.memory_gb("1024M") == 1
+    assert usage.memory_gb("1048576K") == 1
+    assert usage.memory_gb("2.5T") == 2560
+    assert usage.memory_gb(str(1024**3)) == 1
+    assert usage.memory_gb("") is None
+    assert usage.memory_gb("lots") is None
+
+
+def test_parse_sacct_keeps_finished_jobs():
+    jobs = { job['jobid'] : job for job in usage.parse_sacct(sacct_text) }
+    # Failed and running jobs say nothing about what a job needs.
+    assert sorted(jobs) == ['101', '102']
+
+
+def test_parse_sacct_takes_the_largest_step():
+    job = { job['jobid'] : job for job in usage.parse_sacct(sacct_text) }['101']
+    assert job['mem'] == 3
+    assert job['user'] == 'alice'
+    assert job['program'] == 'samtools'
+    assert job['cores'] == 4
+    assert job['hours'] == 1
+    assert job['efficiency'] == 0.5
+
+
+def test_parse_sacct_without_a_comment():
+    job = { job['jobid'] : job for job in usage.parse_sacct(sacct_text) }['102']
+    assert job['program'] == ""
+    assert job['mem'] == 0.5
+    assert job['hours'] == 24
+    assert job['state'] == 'TIMEOUT'
+
+
+def test_parse_sacct_of_nothing():
+    assert list(usage.parse_sacct("")) == []
+    assert list(usage.parse_sacct(sacct_text.splitlines()[0])) == []
+
+
+def test_nearest_rank():
+    values = list(range(1, 11))
+    assert usage.nearest_rank(values, 90) == 9
+    assert usage.nearest_rank(values, 100) == 10
+    assert usage.nearest_rank(values, 0) == 1
+
+
+def test_store_ingest_and_usual(tmp_path):
+    store = usage.UsageStore(str(tmp_path / "usage.db"))
+    records = [ {"jobid":str(i), "user":"alice", "program":"samtools", "ended":1000.0 + i,
+        "mem":float(i), "hours":1.0, "cores":2, "efficiency":0.5} for i in range(1, 11) ]
+    assert store.ingest(records) == 10
+    # Asking again for records that are there does no harm.
+    assert store.ingest(records[:3]) == 3
+    assert store.last_ended() == 1010
+
+    found = store.usual("alice", "samtools", percentile=90, min_jobs=5)
+    assert found == {"mem":9.0, "time":1.0, "cores":1.0}
+    assert store.usual("alice", "gatk", min_jobs=5) == found
+    assert store.usual("bob", min_jobs=5) == {}
+    store.close()
+
+
+def sbatch_comment(text:str) -> str:
+    """
+    The --comment that sbatch would read from a script: only the
+    #SBATCH lines before the first command count.
+    """
+    comment = ""
+    for line in text.splitlines():
+        if line.startswith('#SBATCH --comment='):
+            comment = shlex.split(line.partition('=')[2])[0]
+        elif line.strip() and not line.startswith('#'):
+            break
+    return comment
+
+
+def test_the_comment_in_a_written_script(monkeypatch):
+    monkeypatch.setattr(rules, 'resolve_module', lambda name : ())
+    answers = dict(username='alice', jobname='fit', program='samtools sort -o "x y.bam"',
+        inputfile='a.bam', partition='basic', account='alice', mem=16, cores=8, time=1,
+        start='now', jobfile='/home/alice/fit.slurm', modules='', joblines='',
+        comment='', written='2021-06-30 14:00:00')
+    job = rules.program_basename(types.SimpleNamespace(**answers))
+
+    for name in ('site', 'gpu'):
+        comment = sbatch_comment(script.templates[name].render(JobSpec(**vars(job))))
+        assert comment == 'slurmwriter samtools', name
+        row = f"105|alice|{comment}|4|01:00:00|02:00:00|2G|2021-06-30T14:00:00|COMPLETED"
+        jobs = list(usage.parse_sacct(sacct_text.splitlines()[0] + "\n" + row + "\n"))
+        assert [ job['program'] for job in jobs ] == ['samtools']
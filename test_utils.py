@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the conveniences in utils.
+
+    python -m pytest test_utils.py
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import utils
+
+
+def test_expand_sweep_product():
+    tasks = list(utils.expand_sweep({'a':[1, 2], 'b':['x', 'y', 'z']}))
+    assert len(tasks) == 6
+    assert tasks[0] == {'a':1, 'b':'x'}
+    assert tasks[-1] == {'a':2, 'b':'z'}
+
+
+def test_expand_sweep_zip():
+    tasks = list(utils.expand_sweep(zipped={'b':['x', 'y'], 'c':[3, 4]}))
+    assert tasks == [{'b':'x', 'c':3}, {'b':'y', 'c':4}]
+
+
+def test_expand_sweep_product_and_zip():
+    tasks = list(utils.expand_sweep({'a':[1, 2]}, {'b':['x', 'y'], 'c':[3, 4]}))
+    assert tasks == [
+        {'a':1, 'b':'x', 'c':3}, {'a':1, 'b':'y', 'c':4},
+        {'a':2, 'b':'x', 'c':3}, {'a':2, 'b':'y', 'c':4} ]
+
+
+def test_expand_sweep_nothing():
+    assert list(utils.expand_sweep()) == [{}]
+    assert list(utils.expand_sweep({'a':[]})) == []
+
+
+def test_expand_sweep_uneven_zip():
+    with pytest.raises(ValueError):
+        list(utils.expand_sweep(zipped={'b':['x', 'y'], 'c':[3]}))
+
+
+def test_parse_time_iso():
+    assert utils.parse_time("2021-06-30") == datetime.datetime(2021, 6, 30)
+    assert utils.parse_time(" 2021-06-30T14:00 ") == datetime.datetime(2021, 6, 30, 14)
+
+
+def test_parse_time_today():
+    t = utils.parse_time("14:30")
+    assert (t.date(), t.hour, t.minute, t.second) == (datetime.date.today(), 14, 30, 0)
+    assert utils.parse_time("25:00") is None
+
+
+def test_parse_time_from_now():
+    now = datetime.datetime.now()
+    for s, seconds in (("now", 0), ("+2h", 7200), ("now+1day", 86400), 
+        ("+30 min", 1800), ("+90", 90)):
+        assert abs((utils.parse_time(s) - now).total_seconds() - seconds) < 5
+
+
+def test_parse_time_weekday():
+    for s in ("friday", "Fri"):
+        t = utils.parse_time(s)
+        assert t.weekday() == 4
+        assert 0 <= (t.date() - datetime.date.today()).days < 7
+
+
+def write_as(uid:int, path:str, tree:dict) -> bool:
+    """
+    Call write_tree in a child process that runs as uid.
+    """
+    pid = os.fork()
+    if not pid:
+        try:
+            os.setuid(uid)
+            os._exit(0 if utils.write_tree(path, tree) else 1)
+        finally:
+            os._exit(2)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs root to be two other users")
+def test_write_tree_shared_by_two_users():
+    # Not tmp_path: its parents are closed to other users.
+    shared = os.path.join(tempfile.mkdtemp(), 'cache')
+    try:
+        os.chmod(os.path.dirname(shared), 0o755)
+        utils.make_cache_dir(shared)
+        filename = os.path.join(shared, 'partitions.json')
+
+        assert write_as(1001, filename, {'by':1001})
+        assert write_as(1002, filename, {'by':1002, 'longer':True})
+        assert utils.read_tree(filename) == {'by':1002, 'longer':True}
+        assert write_as(1001, filename, {'by':1001})
+        assert utils.read_tree(filename) == {'by':1001}
+        assert os.stat(filename).st_uid == 1001
+    finally:
+        shutil.rmtree(os.path.dirname(shared))
+
+
+def test_module_index_skips_links_to_directories(tmp_path, monkeypatch):
+    modules = tmp_path / "modulefiles"
+    (modules / "samtools").mkdir(parents=True)
+    (modules / "samtools" / "1.9").write_text("#%Module\n")
+    (modules / "samtools" / "latest").symlink_to(modules / "samtools")
+    (modules / "gatk").symlink_to(modules / "samtools")
+    monkeypatch.setenv('MODULEPATH', str(modules))
+
+    expected = [ str(modules / "samtools" / "1.9") ]
+    index_file = str(tmp_path / "index.json")
+    assert list(utils.all_module_files(index_file)) == expected
+    # And again, from the index.
+    assert list(utils.all_module_files(index_file)) == expected
+
+
+def test_get_file_type_of_a_directory(tmp_path):
+    assert utils.get_file_type(str(tmp_path)) is None
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap timers for the phases of a run of slurmwriter. They are
+always on; each costs two calls to time.perf_counter and a dict
+update, so they can stay in production. slurmwriter --profile
+writes what they found as JSON.
+
+    with timer('sinfo'):
+        text = dorunrun(...)
+
+    @timed('module scan')
+    def module_files(): ...
+"""
+
+import typing
+from   typing import *
+
+###
+# Standard imports.
+###
+
+import functools
+import math
+import os
+import socket
+import sys
+import time
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# name -> [number of times, total seconds]. A phase that happens
+# inside another is counted in both.
+###
+totals = {}
+
+
+class timer:
+    """
+    Add the time spent in the with-block to the phase called name.
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name:str):
+        self.name = name
+
+    def __enter__(self) -> 'timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> bool:
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def interpreter_start(started:float) -> float:
+    """
+    Seconds from the start of the process to the moment (on the
+    perf_counter clock) when the program started running, or None
+    where the kernel does not say when the process started.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may have spaces; the fields after it do not.
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        since_boot = time.clock_gettime(time.CLOCK_BOOTTIME) - (time.perf_counter() - started)
+        return max(0.0, since_boot - ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError) as e:
+        return None
+
+
+def record(name:str, seconds:float) -> None:
+    try:
+        entry = totals[name]
+        entry[0] += 1
+        entry[1] += seconds
+    except KeyError as e:
+        totals[name] = [1, seconds]
+
+
+def report(started:float, **extra) -> dict:
+    """
+    Everything the timers found, with enough about the run to tell
+    one login node from another.
+    """
+    return {"host":socket.gethostname(), "pid":os.getpid(),
+        "when":time.strftime('%Y-%m-%d %H:%M:%S'), "argv":sys.argv[1:],
+        "interpreter_start":interpreter_start(started),
+        "total":time.perf_counter() - started,
+        "phases":{ k : {"calls":n, "seconds":t} for k, (n, t) in totals.items() },
+        **extra}
+
+
+def timed(name:str) -> Callable:
+    """
+    A decorator that times every call of the function as the phase
+    called name.
+    """
+    def decorator(func:Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwds):
+            with timer(name):
+                return func(*args, **kwds)
+        return wrapper
+    return decorator
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+The usage store remembers what jobs really used: their peak memory,
+how long they ran, and how busy their cores were. It is a SQLite
+file, filled from the output of sacct --parsable2,
+
+    python usage.py --ingest [--input sacct.txt] [--all]
+
+and slurmwriter offers a percentile of what a user's earlier jobs
+with the same program used as the defaults for memory, cores, and
+time, rather than the same constants for everyone.
+
+Only the records that are new since the last time are asked for,
+and asking again for a record that is already there does no harm.
+"""
+
+import typing
+from   typing import *
+
+min_py = (3, 8)
+
+###
+# Standard imports.
+###
+
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+import argparse
+import datetime
+import math
+import re
+import sqlite3
+import threading
+import time
+
+# Credits
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2021'
+__credits__ = None
+__version__ = str(math.pi**2)[:5]
+__maintainer__ = 'George Flanagin'
+__email__ = ['me+ur@georgeflanagin.com', 'gflanagin@richmond.edu']
+__status__ = 'Teaching example'
+__license__ = 'MIT'
+
+###
+# Parts of this project.
+###
+
+import utils
+
+###
+# The columns we ask sacct for. MaxRSS is only reported for the
+# steps of a job, so a job's peak memory is the largest of its
+# steps'. The program is in the comment slurmwriter writes in each
+# job, "slurmwriter <program> ..."; jobs without it count toward the
+# user's usage, but not any program's.
+###
+sacct_fields = ('JobID', 'User', 'Comment', 'AllocCPUS', 'Elapsed',
+    'TotalCPU', 'MaxRSS', 'End', 'State')
+
+# Jobs in other states did not run long enough to say anything.
+finished_states = ('COMPLETED', 'TIMEOUT', 'OUT_OF_MEMORY')
+
+memory_units = {'': 1/1024**3, 'K': 1/1024**2, 'M': 1/1024, 'G': 1, 'T': 1024, 'P': 1024**2}
+
+schema = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        jobid TEXT PRIMARY KEY,
+        user TEXT NOT NULL,
+        program TEXT NOT NULL,
+        ended REAL NOT NULL,
+        mem REAL,
+        hours REAL,
+        cores INTEGER,
+        efficiency REAL);
+    CREATE INDEX IF NOT EXISTS jobs_by_program ON jobs (user, program, ended);
+    CREATE INDEX IF NOT EXISTS jobs_by_user ON jobs (user, ended);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value);
+    """
+
+
+class UsageStore:
+    """
+    The jobs, one row apiece, indexed by user and program so that
+    finding the recent jobs of one program does not read the others.
+    """
+
+    def __init__(self, filename:str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connect()
+
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        The connection for this process. A process forked after the
+        store was opened gets a connection of its own.
+        """
+        if self.pid != os.getpid():
+            self.db = sqlite3.connect(self.filename, timeout=10, check_same_thread=False)
+            self.db.executescript(schema)
+            self.pid = os.getpid()
+        return self.db
+
+
+    def close(self) -> None:
+        if self.pid == os.getpid(): self.db.close()
+        self.pid = None
+
+
+    def ingest(self, records:Iterable[dict]) -> int:
+        """
+        Add the records from parse_sacct, replacing any that are
+        already here. Returns the number of records.
+        """
+        n = 0
+        latest = self.last_ended()
+        with self.lock, self.connect() as db:
+            for record in records:
+                db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    tuple(record[_] for _ in ('jobid', 'user', 'program', 'ended',
+                        'mem', 'hours', 'cores', 'efficiency')))
+                latest = max(latest, record['ended'])
+                n += 1
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('last_ended', ?)", (latest,))
+        return n
+
+
+    def last_ended(self) -> float:
+        """
+        When the latest job in the store ended, or 0.
+        """
+        with self.lock:
+            row = self.connect().execute("SELECT value FROM meta WHERE key = 'last_ended'").fetchone()
+        return row[0] if row else 0
+
+
+    def usual(self, user:str, program:str="",
+        percentile:float=90,
+        window:int=100,
+        min_jobs:int=5) -> dict:
+        """
+        The percentile of the memory (GB), time (hours), and cores that
+        the user's latest window jobs with this program used, or with
+        any program if there are fewer than min_jobs of those. The
+        cores used are the cores asked for times how busy they were.
+        Returns {} if the user has too few jobs to say.
+        """
+        queries = [ ("SELECT mem, hours, cores * efficiency FROM jobs WHERE user = ? "
+            "ORDER BY ended DESC LIMIT ?", (user, window)) ]
+        if program:
+            queries.insert(0, ("SELECT mem, hours, cores * efficiency FROM jobs "
+                "WHERE user = ? AND program = ? ORDER BY ended DESC LIMIT ?", (user, program, window)))
+
+        with self.lock:
+            for query, args in queries:
+                rows = self.connect().execute(query, args).fetchall()
+                if len(rows) >= min_jobs: break
+            else:
+                return {}
+
+        found = {}
+        for k, column in zip(('mem', 'time', 'cores'), zip(*rows)):
+            values = [ _ for _ in column if _ is not None ]
+            if len(values) >= min_jobs: found[k] = nearest_rank(values, percentile)
+        return found
+
+
+def memory_gb(s:str) -> float:
+    """
+    sacct's memory, like 1234K or 2.5G, in GB.
+    """
+    found = re.fullmatch(r'([\d.]+)([KMGTP]?)', s.strip())
+    return float(found.group(1)) * memory_units[found.group(2)] if found else None
+
+
+def nearest_rank(values:List[float], percentile:float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+def open_store(filename:str) -> UsageStore:
+    """
+    Open the store, making it if it is not there. Returns None if
+    it cannot be opened; the store is a convenience, never a
+    requirement.
+    """
+    try:
+        utils.make_cache_dir(os.path.dirname(filename))
+        return UsageStore(filename)
+    except (OSError, sqlite3.Error) as e:
+        return None
+
+
+def parse_sacct(text:str) -> Iterable[dict]:
+    """
+    A generator of the finished jobs in the output of sacct_command,
+    one record for each job, with the largest MaxRSS of its steps.
+    """
+    jobs = {}
+    lines = iter(text.splitlines())
+    names = next(lines, "").split('|')
+    for line in lines:
+        row = dict(zip(names, line.split('|')))
+        jobid, _, step = row.get('JobID', "").partition('.')
+        if not jobid: continue
+
+        job = jobs.setdefault(jobid, {"jobid":jobid, "mem":None})
+        mem = memory_gb(row.get('MaxRSS', ""))
+        if mem is not None: job['mem'] = max(mem, job['mem'] or 0)
+        if step: continue
+
+        job['state'] = row.get('State', "").split()[0] if row.get('State') else ""
+        job['user'] = row.get('User', "")
+        comment = row.get('Comment', "").split()
+        job['program'] = comment[1] if len(comment) > 1 and comment[0] == 'slurmwriter' else ""
+        job['cores'] = int(row.get('AllocCPUS') or 0)
+        elapsed = seconds(row.get('Elapsed', ""))
+        job['hours'] = elapsed / 3600 if elapsed else None
+        busy = seconds(row.get('TotalCPU', ""))
+        job['efficiency'] = (min(1.0, busy / (elapsed * job['cores']))
+            if elapsed and job['cores'] and busy is not None else None)
+        try:
+            job['ended'] = datetime.datetime.fromisoformat(row.get('End', "")).timestamp()
+        except ValueError as e:
+            job['ended'] = None
+
+    for job in jobs.values():
+        if job.get('ended') and job.get('user') and job['state'] in finished_states:
+            yield job
+
+
+def sacct_command(user:str=None, since:float=0) -> List[str]:
+    """
+    The sacct command for the jobs of user (everyone's, if user is
+    None) that finished after since.
+    """
+    return ['sacct', '--parsable2', *(['-a'] if user is None else ['-u', user]),
+        '-S', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(since)), '-E', 'now',
+        '-s', 'CD,TO,OOM', f"--format={','.join(sacct_fields)}"]
+
+
+def seconds(s:str) -> float:
+    """
+    sacct's [DD-][HH:]MM:SS[.sss] in seconds, or None.
+    """
+    days, _, hms = s.strip().rpartition('-')
+    try:
+        parts = [ float(_) for _ in hms.split(':') ]
+        return (int(days or 0) * 86400 +
+            sum(p * 60**i for i, p in enumerate(reversed(parts)))) if parts else None
+    except ValueError as e:
+        return None
+
+
+def usage_main(myargs:argparse.Namespace) -> int:
+    import rules
+
+    store = open_store(myargs.output)
+    if store is None:
+        print(f"{myargs.output} cannot be opened.")
+        return os.EX_CANTCREAT
+
+    if myargs.ingest:
+        if myargs.input:
+            f = sys.stdin if myargs.input == '-' else open(myargs.input)
+            with f: text = f.read()
+        else:
+            since = store.last_ended() or time.time() - rules.params.usage.days * 86400
+            code, text, err = utils.dorunrun(sacct_command(None if myargs.all else rules.mynetid,
+                since - rules.params.usage.overlap), timeout=300, return_datatype=tuple)
+            if code:
+                print(f"sacct failed: {err}")
+                return os.EX_UNAVAILABLE
+        n = store.ingest(parse_sacct(text))
+        myargs.verbose and print(f"Added {n} jobs to {myargs.output}")
+        return os.EX_OK
+
+    for user, program, n in store.connect().execute(
+        "SELECT user, program, count(*) FROM jobs GROUP BY user, program ORDER BY user, program"):
+        print(f"    {user} {program or '(any)'} : {n} jobs, usually "
+            f"{store.usual(user, program, rules.params.usage.percentile)}")
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+    import rules
+
+    parser = argparse.ArgumentParser(prog="usage",
+        description="Fill or show the store of what earlier jobs used.")
+
+    parser.add_argument('--all', action='store_true',
+        help="Ask sacct about everyone's jobs, not only yours.")
+    parser.add_argument('--ingest', action='store_true',
+        help="Add the new jobs to the store. Without this option, print a summary.")
+    parser.add_argument('-i', '--input', type=str, default="",
+        help="Read the output of sacct --parsable2 from this file (or - for stdin) rather than running sacct.")
+    parser.add_argument('-o', '--output', type=str, default=rules.params.usage.file,
+        help="Name of the store.")
+    parser.add_argument('-v', '--verbose', action='store_true')
+
+    myargs = parser.parse_args()
+    sys.exit(usage_main(myargs))
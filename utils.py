@@ -18,17 +18,27 @@ if sys.version_info < min_py:
     print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
     sys.exit(os.EX_SOFTWARE)
 
+import collections
+import concurrent.futures
+import csv
 import datetime
+import fcntl
 import fnmatch
+import functools
 import getpass
 import grp
+import itertools
+import json
 import math
+import mmap
 import pwd
+import re
+import shlex
 import socket
 import stat
 import subprocess
-
-import dateparser
+import tempfile
+import time
 
 
 # Credits
@@ -42,23 +52,107 @@ __status__ = 'Teaching example'
 __license__ = 'MIT'
 
 from   sloppytree import SloppyTree
+import timings
+
+###
+# The number of threads used to read the headers of files when
+# we are finding their types. Nearly all the time is spent waiting
+# on the file server, so this can be larger than the number of cores.
+###
+SCAN_WORKERS = 16
+
+###
+# A command written as a string needs the shell only if it uses
+# something that only the shell understands.
+###
+shell_syntax = re.compile(r"""[|&;<>()$`\\*?\[\]{}~#\n]|^\s*\w+=""")
+
+async def adorunrun(command:Union[str, list],
+    timeout:int=None,
+    verbose:bool=False,
+    quiet:bool=False,
+    return_datatype:type=bool
+    ) -> tuple:
+    """
+    dorunrun for asyncio, so that several commands can be waited for
+    at once. The arguments and the values returned are the same as
+    those of dorunrun. A string is run without the shell unless it
+    needs one. If the time runs out, or the caller is cancelled, the
+    child process is killed.
+    """
+    import asyncio
+
+    if verbose: sys.stderr.write(f"{command=}\n")
+
+    if isinstance(command, (list, tuple)):
+        command = [str(_) for _ in command]
+
+    elif isinstance(command, str):
+        if not needs_shell(command): command = shlex.split(command)
+
+    else:
+        raise Exception(f"Bad argument type to adorunrun: {command}")
+
+    try:
+        if isinstance(command, str):
+            child = await asyncio.create_subprocess_shell(command,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        else:
+            child = await asyncio.create_subprocess_exec(*command,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except Exception as e:
+        raise Exception(f"Unexpected error: {str(e)}")
+
+    try:
+        stdout, stderr = await asyncio.wait_for(child.communicate(), timeout)
+
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        try:
+            child.kill()
+        except ProcessLookupError as e:
+            pass
+        await child.wait()
+        if isinstance(e, asyncio.CancelledError): raise
+        raise Exception(f"Process exceeded time limit at {timeout} seconds.")
+
+    return run_result(child.returncode, 
+        stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace'),
+        return_datatype)
+
 
 def all_files_in(s:str, 
     ignore_hidden:bool=True) -> str:
     """
     A generator to cough up the full file names for every
     file in a directory.
-    """
-    global HIDDENFILES
 
+    The tree is read with os.scandir, so the type of each entry
+    comes from the directory listing rather than a stat, and hidden
+    directories are skipped without being read. As with os.walk,
+    links to directories are not followed.
+    """
     s = expandall(s)
-    for c, d, files in os.walk(s):
-        for f in files:
-            fullname = os.path.join(c, f)
-            if ignore_hidden and "/." in fullname: 
-                pass
-            else:
-                yield fullname
+    stack = [s]
+    while stack:
+        d = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if ignore_hidden and e.name.startswith('.'): continue
+                    try:
+                        is_dir = e.is_dir()
+                    except OSError as e_:
+                        is_dir = False
+                    if not is_dir:
+                        yield e.path
+                    elif not e.is_symlink():
+                        subdirs.append(e.path)
+        except OSError as e:
+            continue
+
+        # Reversed so that the directories are visited in the order listed.
+        stack.extend(reversed(subdirs))
 
 
 def all_files_like(dir_to_search:str, 
@@ -82,22 +176,201 @@ def all_files_of_type(dir_to_search:str,
     A generator to get the file names of a particular type.
     The types are shown in the filetypes dict.
     """
-    for f in all_files_in(dir_to_search, ignore_hidden):
-        if get_file_type(f) == file_type.upper():
+    file_type = file_type.upper()
+    for f, t in file_types(all_files_in(dir_to_search, ignore_hidden)):
+        if t == file_type:
             yield f
         else:
             continue
 
 
-def all_module_files() -> str:
+def all_module_files(index_file:str=None) -> str:
     """
     This generator locates all module files that are located in
     the directories that are members of MODULEPATH.
+
+    index_file -- if given, the name of a file where we remember what
+        we found, directory by directory. Only the directories whose
+        mtime has changed since the last run are read again. The
+        index is rewritten when the generator is exhausted.
     """
-    for location in os.getenv('MODULEPATH', "").split(':'):
-        for f in all_files_of_type(location, 'mod'):
+    locations = [ _ for _ in os.getenv('MODULEPATH', "").split(':') if _ ]
+    if index_file is None:
+        for location in locations:
+            for f in all_files_of_type(location, 'mod'):
+                yield f
+        return
+
+    index_file = expandall(index_file)
+    try:
+        with open(index_file) as f:
+            old_index = json.load(f)
+    except (OSError, ValueError) as e:
+        old_index = {}
+
+    new_index = {}
+    for location in locations:
+        for f in indexed_files_of_type(expandall(location), 'mod', old_index, new_index):
             yield f
 
+    if new_index != old_index:
+        try:
+            make_cache_dir(os.path.dirname(index_file))
+            write_tree(index_file, new_index)
+        except OSError as e:
+            pass
+
+
+def atomic_write(path:str, text:str) -> None:
+    """
+    Write text to path by writing a file beside it and renaming it
+    into place, so that path is always either the old file or the
+    new one, and never part of either. The file keeps the permissions
+    of the one it replaces; a new file gets those open() would give it.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError as e:
+        mode = 0o666 & ~current_umask()
+
+    fd, tempname = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tempname, mode)
+        os.replace(tempname, path)
+    except:
+        os.unlink(tempname)
+        raise
+
+
+def batches(iterable:Iterable, n:int) -> list:
+    """
+    A generator of lists of n items from iterable. The
+    last list may be shorter.
+    """
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch: return
+        yield batch
+
+
+def cached_tree(filename:str,
+    builder:Callable[[], SloppyTree],
+    ttl:int,
+    refresh:bool=False) -> SloppyTree:
+    """
+    Return the SloppyTree stored in filename if it is younger than
+    ttl seconds; otherwise call builder() to make a new one and store it.
+
+    Only one process at a time refreshes the file. The others either
+    read the stale copy (if there is one), or wait for the refresh
+    to finish. If the cache cannot be read or written, we just call
+    builder() -- the cache is a convenience, never a requirement.
+
+    filename -- where the tree is kept, as JSON.
+    builder -- a function with no arguments that builds the tree.
+    ttl -- age in seconds after which the file is considered stale.
+    refresh -- if True, ignore the contents of the file and rebuild it.
+    """
+    filename = expandall(filename)
+    try:
+        make_cache_dir(os.path.dirname(filename))
+        lockfd = os.open(f"{filename}.lock", os.O_RDONLY | os.O_CREAT, 0o666)
+    except OSError as e:
+        return builder()
+
+    try:
+        if not refresh and file_age(filename) < ttl:
+            tree = read_tree(filename)
+            if tree is not None: return tree
+
+        try:
+            fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as e:
+            # Someone else is refreshing. Use what is there, or wait for it.
+            tree = None if refresh else read_tree(filename)
+            if tree is not None: return tree
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            tree = read_tree(filename)
+            if tree is not None and file_age(filename) < ttl: return tree
+
+        else:
+            # We hold the lock, but someone may have finished a refresh
+            # between our look at the file and our getting the lock.
+            if not refresh and file_age(filename) < ttl:
+                tree = read_tree(filename)
+                if tree is not None: return tree
+
+        tree = builder()
+        write_tree(filename, tree)
+        return tree
+
+    finally:
+        os.close(lockfd)
+
+
+def claim_refresh(filename:str, ttl:int, refresh:bool=False) -> int:
+    """
+    Take the lock that cached_tree takes to refresh filename, for a
+    caller that will build the tree some other way and write it
+    with write_tree.
+
+    returns -- the locked descriptor, to be closed once the file
+        is written, or None if the file is still fresh, someone else
+        is refreshing it, or the cache cannot be used.
+    """
+    filename = expandall(filename)
+    try:
+        make_cache_dir(os.path.dirname(filename))
+        lockfd = os.open(f"{filename}.lock", os.O_RDONLY | os.O_CREAT, 0o666)
+    except OSError as e:
+        return None
+
+    try:
+        fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError as e:
+        os.close(lockfd)
+        return None
+
+    # Someone may have finished a refresh before we got the lock.
+    if not refresh and file_age(filename) < ttl:
+        os.close(lockfd)
+        return None
+    return lockfd
+
+
+def cluster_description(params:SloppyTree, refresh:bool=False) -> SloppyTree:
+    """
+    The partition tree from parse_sinfo, read from the cache in
+    params.cache.dir when it is fresh enough.
+    """
+    return cached_tree(
+        os.path.join(params.cache.dir, 'partitions.json'),
+        lambda : parse_sinfo(params),
+        params.cache.ttl,
+        refresh)
+
+
+@functools.lru_cache(maxsize=None)
+def current_umask() -> int:
+    """
+    Linux shows the umask in /proc. Elsewhere there is no way to
+    read the umask without setting it, and setting it, even for a
+    moment, changes the files made by every other thread; so it is
+    read once, when this file is imported, before there are any.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'): return int(line.split()[1], 8)
+    except (OSError, ValueError) as e:
+        pass
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
 
 def dorunrun(command:Union[str, list],
     timeout:int=None,
@@ -143,19 +416,7 @@ def dorunrun(command:Union[str, list],
             text=True,
             shell=shell)
 
-        code = result.returncode
-        if return_datatype is bool:
-            return code == 0
-        elif return_datatype is int:
-            return code
-        elif return_datatype is str:
-            return result.stdout
-        elif return_datatype is tuple:
-            return code, result.stdout, result.stderr
-        elif return_datatype is dict:
-            return {"code":code, "stdout":result.stdout, "stderr":result.stderr}
-        else:
-            raise Exception(f"Unknown: {return_datatype=}")
+        return run_result(result.returncode, result.stdout, result.stderr, return_datatype)
         
     except subprocess.TimeoutExpired as e:
         raise Exception(f"Process exceeded time limit at {e.timeout} seconds.")    
@@ -164,6 +425,30 @@ def dorunrun(command:Union[str, list],
         raise Exception(f"Unexpected error: {str(e)}")
 
 
+def dorunrun_all(commands:Dict[str, Union[str, list]],
+    timeout:int=None,
+    return_datatype:type=bool) -> Dict[str, object]:
+    """
+    Run the commands at the same time, so that waiting for all of
+    them takes as long as the slowest one rather than the sum of them.
+
+    commands -- the commands, as dorunrun takes them, by name.
+    timeout -- seconds allowed for each command.
+
+    returns -- a dict with the same names. Each value is what dorunrun
+        would have returned, or the Exception it would have raised.
+    """
+    import asyncio
+
+    async def run_all() -> Dict[str, object]:
+        results = await asyncio.gather(
+            *( adorunrun(c, timeout, return_datatype=return_datatype) for c in commands.values() ),
+            return_exceptions=True)
+        return dict(zip(commands, results))
+
+    return asyncio.run(run_all())
+
+
 def expandall(s:str) -> str:
     """
     Expand all the user vars into an absolute path name. If the
@@ -173,6 +458,61 @@ def expandall(s:str) -> str:
         else os.path.abspath(os.path.expandvars(os.path.expanduser(s))))
 
 
+def expand_sweep(product:dict=None, zipped:dict=None) -> dict:
+    """
+    A generator of the parameters for each task in a sweep. The
+    lists in product are crossed with each other; the lists in
+    zipped are taken in step with each other, and must all be the
+    same length. If there are both, each combination from product
+    is paired with each step through zipped.
+
+        expand_sweep({'a':[1, 2]}, {'b':['x', 'y'], 'c':[3, 4]}) ->
+            {'a':1, 'b':'x', 'c':3}, {'a':1, 'b':'y', 'c':4},
+            {'a':2, 'b':'x', 'c':3}, {'a':2, 'b':'y', 'c':4}
+    """
+    product = product if product else {}
+    zipped = zipped if zipped else {}
+    if len(set(len(v) for v in zipped.values())) > 1:
+        raise ValueError("The lists to be zipped are not all the same length.")
+
+    for p in itertools.product(*product.values()):
+        p = dict(zip(product.keys(), p))
+        for z in zip(*zipped.values()) if zipped else ((),):
+            yield {**p, **dict(zip(zipped.keys(), z))}
+
+
+def file_age(path:str) -> float:
+    """
+    Seconds since path was last modified, or infinity if there is no
+    such file.
+    """
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except OSError as e:
+        return math.inf
+
+
+def file_types(paths:Iterable[str], 
+    workers:int=SCAN_WORKERS) -> Tuple[str, str]:
+    """
+    A generator of (path, type) for each of the paths, in the same
+    order. The files are read by a pool of threads, with no more
+    than a few reads per thread waiting, so that a long stream of
+    paths does not pile up in memory.
+    """
+    waiting = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for path in paths:
+            waiting.append((path, pool.submit(get_file_type, path)))
+            if len(waiting) >= 4*workers:
+                path, future = waiting.popleft()
+                yield path, future.result()
+
+        while waiting:
+            path, future = waiting.popleft()
+            yield path, future.result()
+
+
 filetypes = {
     b"%PDF-1." : "PDF",
     b"#%Module" : "MOD",
@@ -185,6 +525,25 @@ filetypes = {
     }
 
 
+def find_executables(locations:Iterable[str]) -> Dict[str, str]:
+    """
+    The programs in the directories of locations, name -> path. When
+    two directories have a program of the same name, the first one
+    wins, as it would in the PATH.
+    """
+    found = {}
+    for location in locations:
+        try:
+            with os.scandir(expandall(location)) as entries:
+                for entry in entries:
+                    if (entry.name not in found and entry.is_file() 
+                        and os.access(entry.path, os.X_OK)):
+                        found[entry.name] = entry.path
+        except OSError as e:
+            continue
+    return found
+
+
 def get_file_type(path:str) -> str:
     """
     By inspection, return the presumed type of the file located 
@@ -206,6 +565,10 @@ def get_file_type(path:str) -> str:
         # We have execute on the directory, but not read on the file within.
         return None
 
+    except OSError as e:
+        # A directory, or anything else that cannot be read.
+        return None
+
     for k, v in filetypes.items():
         if shred.startswith(k): return v
 
@@ -250,30 +613,222 @@ def hours_to_hms(h:float) -> str:
         f"{days}-{hours:02}:{minutes:02}:{seconds:02}" )
 
 
-def mygroups() -> Tuple[str]:
+def indexed_files_of_type(d:str,
+    file_type:str,
+    old_index:dict,
+    new_index:dict) -> str:
+    """
+    Like all_files_of_type, but consult old_index before looking
+    at the disk. The entry for each directory is
+
+        { "mtime" : the directory's st_mtime_ns,
+          "files" : { name : [ file type, the file's st_mtime_ns ] },
+          "dirs"  : [ names of subdirectories ] }
+
+    An entry whose mtime matches the directory is used as it is, so
+    an unchanged tree costs one stat per directory and no opens. In
+    a changed directory, only files that are new or modified are
+    opened to find their type. Every entry that is visited is copied
+    to new_index. Hidden files and directories are skipped.
+    """
+    try:
+        mtime = os.stat(d).st_mtime_ns
+    except OSError as e:
+        return
+
+    entry = old_index.get(d)
+    if entry is None or entry['mtime'] != mtime:
+        known = entry['files'] if entry else {}
+        files = {}
+        dirs = []
+        unknown = []
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.name.startswith('.'): continue
+                    # Like os.walk, do not follow links to directories,
+                    # and do not take them for files either.
+                    if e.is_dir():
+                        if not e.is_symlink(): dirs.append(e.name)
+                        continue
+                    try:
+                        f_mtime = e.stat().st_mtime_ns
+                    except OSError as e_:
+                        f_mtime = 0
+                    if e.name in known and known[e.name][1] == f_mtime:
+                        files[e.name] = known[e.name]
+                    else:
+                        files[e.name] = [None, f_mtime]
+                        unknown.append(e.path)
+        except OSError as e:
+            return
+        for path, t in file_types(unknown) if unknown else ():
+            files[os.path.basename(path)][0] = t
+        entry = {"mtime":mtime, "files":files, "dirs":dirs}
+
+    new_index[d] = entry
+    file_type = file_type.upper()
+    for name, (t, f_mtime) in entry['files'].items():
+        if t == file_type: yield os.path.join(d, name)
+
+    for name in entry['dirs']:
+        yield from indexed_files_of_type(os.path.join(d, name), file_type, old_index, new_index)
+
+
+def make_cache_dir(d:str) -> str:
+    """
+    Create a cache directory, and make sure that it is safe to use.
+    Returns the name, or raises PermissionError if it is not safe.
+
+    A directory named for the user is the user's own. It is made
+    0o700, and it is not used unless it belongs to the user. Any
+    other cache directory is shared by every user on this node, so
+    that one user's refresh serves everyone. It is made 0o1777 (like
+    /tmp), so that nobody can delete or replace another's files; they
+    can only rewrite them, under their locks (see write_tree).
+    """
+    private = os.path.basename(d.rstrip('/')) == getpass.getuser()
+    try:
+        if private: make_cache_dir(os.path.dirname(d.rstrip('/')))
+        os.mkdir(d, 0o700)
+        os.chmod(d, 0o700 if private else 0o1777)
+    except FileExistsError as e:
+        pass
+
+    info = os.stat(d)
+    if private and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise PermissionError(f"{d} is not yours alone.")
+    if info.st_mode & stat.S_IWOTH and not info.st_mode & stat.S_ISVTX:
+        raise PermissionError(f"Anyone can replace the files in {d}.")
+    return d
+
+
+def module_default(directory:str) -> str:
+    """
+    The version of the modules in directory that the site has made
+    the default, with a "default" link or a .version file, or "" if
+    it has not.
+    """
+    if not directory: return ""
+    try:
+        target = os.readlink(os.path.join(directory, 'default'))
+        return os.path.basename(target)[:-4] if target.endswith('.lua') else os.path.basename(target)
+    except OSError as e:
+        pass
+
+    try:
+        with open(os.path.join(directory, '.version')) as f:
+            found = re.search(r'set\s+ModulesVersion\s+"?([^"\s]+)', f.read())
+        return found.group(1) if found else ""
+    except OSError as e:
+        return ""
+
+
+def module_name_version(location:str, path:str) -> Tuple[str, str]:
+    """
+    Split the path of a module file into the name and version that
+    "module load" understands. location is the MODULEPATH directory
+    where the file was found, so
+
+        /usr/local/sw/modulefiles/gatk/4.2.0.0 -> ('gatk', '4.2.0.0')
+        /usr/local/sw/modulefiles/qe           -> ('qe', '')
+    """
+    name = os.path.relpath(path, location)
+    if name.endswith('.lua'): name = name[:-4]
+    name, _, version = name.rpartition('/')
+    return (name, version) if name else (version, '')
+
+
+def mygroups(check_slurm:bool=False, accounts_result:tuple=None) -> Tuple[str]:
     """
     Collect the group information for the current user, including
-    the self associated group, if any.
+    the self associated group, if any. Only the user's own groups
+    are looked up; we do not read the whole group database.
+
+    check_slurm -- if True, and SLURM will tell us the accounts
+        the user is associated with, return all of the accounts, and
+        only the accounts, so that we never offer an account that
+        sbatch will refuse, nor leave out one it would take. The
+        accounts that are also the user's groups come first.
+    accounts_result -- passed to slurm_accounts, if the caller has
+        already asked sacctmgr.
     """
     mynetid = getpass.getuser()
-    
-    groups = [g.gr_name for g in grp.getgrall() if mynetid in g.gr_mem]
     primary_group = pwd.getpwnam(mynetid).pw_gid
+
+    groups = []
+    for gid in os.getgrouplist(mynetid, primary_group):
+        if gid == primary_group: continue
+        try:
+            name = grp.getgrgid(gid).gr_name
+        except KeyError as e:
+            # A gid with no name.
+            continue
+        if name not in groups: groups.append(name)
     groups.append(grp.getgrgid(primary_group).gr_name)
+
+    accounts = slurm_accounts(mynetid, accounts_result) if check_slurm else None
+    if accounts:
+        groups = ([ g for g in groups if g in accounts ] + 
+            sorted(a for a in accounts if a not in groups))
     return tuple(groups)
     
 
-def parse_sinfo(params:SloppyTree) -> SloppyTree:
+def needs_shell(command:str) -> bool:
+    """
+    True if the command uses pipes, redirection, variables, wildcards,
+    or anything else that only the shell understands.
+    """
+    return shell_syntax.search(command) is not None
+
+
+def parse_node_state(params:SloppyTree, text:str=None) -> SloppyTree:
+    """
+    Ask SLURM how busy the nodes are right now, and add it up by
+    partition. Returns a SloppyTree like
+
+        { partition : { idle_cores : int, free_ram : GB } }
+
+    A node in more than one partition is counted in each of them.
+
+    text -- the output of sinfo, if the caller has already run it.
+    """
+    if text is None:
+        with timings.timer('sinfo node state'):
+            text = dorunrun(f"{params.querytool.exe()} {params.nodestate.opts}", return_datatype=str)
+    tree = SloppyTree()
+    for line in ( _ for _ in text.split('\n') if _.strip() ):
+        try:
+            node, partition, cpus, free_mem = line.split()
+            allocated, idle, other, total = cpus.split('/')
+        except ValueError as e:
+            continue
+
+        partition = partition.rstrip('*')
+        p = tree[partition]
+        p.idle_cores = p.get('idle_cores', 0) + int(idle)
+        free_mem = int(free_mem)//1000 if free_mem.isdigit() else 0
+        p.free_ram = p.get('free_ram', 0) + free_mem
+
+    return tree
+
+
+def parse_sinfo(params:SloppyTree, text:str=None) -> SloppyTree:
     """
     Query the current environment to get the description of the
     cluster. Return it as a SloppyTree.
+
+    text -- the output of sinfo, if the caller has already run it.
     """
 
     # These options give us information about cpus, memory, and
     # gpus on the partitions. The first line of the output
     # is just headers.
-    cmdline = f"{params.querytool.exe} {params.querytool.opts}"
-    result = dorunrun( cmdline, return_datatype=str).split('\n')[1:]
+    if text is None:
+        cmdline = f"{params.querytool.exe()} {params.querytool.opts}"
+        with timings.timer('sinfo'):
+            text = dorunrun( cmdline, return_datatype=str)
+    result = text.split('\n')[1:]
 
     partitions = []
     cores = []
@@ -313,6 +868,74 @@ def parse_sinfo(params:SloppyTree) -> SloppyTree:
     return tree
 
 
+def parse_time(s:str) -> datetime.datetime:
+    """
+    Understand the ways people usually say when a job should start,
+    or return None. The answer is remembered, but only for the
+    current minute, because "now" and "+2h" mean something else
+    a minute later.
+    """
+    return parse_time_at(s.strip(), int(time.time() // 60))
+
+
+weekdays = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+time_of_day = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+time_from_now = re.compile(r"^(?:now)?\s*\+\s*(\d+)\s*([a-z]*)$")
+time_units = { 's':1, 'sec':1, 'second':1, 'seconds':1, 
+    'm':60, 'min':60, 'minute':60, 'minutes':60, 
+    'h':3600, 'hour':3600, 'hours':3600, 
+    'd':86400, 'day':86400, 'days':86400, 
+    'w':604800, 'week':604800, 'weeks':604800 }
+
+@functools.lru_cache(maxsize=1024)
+def parse_time_at(s:str, minute:int) -> datetime.datetime:
+    """
+    The work of parse_time. minute is only there to be part of the
+    key to the cache. These are handled here:
+
+        now, today, tomorrow
+        2021-06-30, 2021-06-30T14:00, 2021-06-30 14:00:00
+        14:00, 14:00:30           -- today
+        +2h, +30min, now+1day     -- from now. A bare number is seconds.
+        friday, fri               -- the next one, at midnight.
+
+    Anything else is left to dateparser, which we import only when
+    we need it, because it takes a long time to import.
+    """
+    now = datetime.datetime.now()
+    word = s.lower()
+
+    if word in ('now', 'today'): return now
+    if word == 'tomorrow': return now + datetime.timedelta(days=1)
+
+    try:
+        return datetime.datetime.fromisoformat(s)
+    except ValueError as e:
+        pass
+
+    match = time_of_day.match(word)
+    if match:
+        h, m, sec = (int(_) if _ else 0 for _ in match.groups())
+        try:
+            return now.replace(hour=h, minute=m, second=sec, microsecond=0)
+        except ValueError as e:
+            return None
+
+    match = time_from_now.match(word)
+    if match and (not match.group(2) or match.group(2) in time_units):
+        n, unit = match.groups()
+        return now + datetime.timedelta(seconds=int(n) * time_units.get(unit, 1))
+
+    for i, day in enumerate(weekdays):
+        if word in (day, day[:3]):
+            if i == now.weekday(): return now
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            return midnight + datetime.timedelta(days=(i - now.weekday()) % 7)
+
+    import dateparser
+    return dateparser.parse(s)
+
+
 def programs_w_modules() -> str:
     """
     Generate the names of programs that have module files.
@@ -336,6 +959,125 @@ def programs_w_modules() -> str:
         yield program
 
 
+def read_manifest(filename:str) -> Tuple[int, dict, str]:
+    """
+    A generator of the job requests in a manifest file. If the name
+    ends in .csv, the first line holds the names of the columns;
+    otherwise, each line is a JSON object. "-" means stdin. Blank
+    lines are skipped.
+
+    yields -- (line number, the record, None), or (line number,
+        None, a description of the problem) if the line cannot be read.
+    """
+    f = sys.stdin if filename == '-' else open(expandall(filename), newline='')
+    try:
+        if filename.lower().endswith('.csv'):
+            reader = csv.DictReader(f)
+            for record in reader:
+                if None in record:
+                    yield reader.line_num, None, "more values than there are columns."
+                else:
+                    yield reader.line_num, record, None
+            return
+
+        for n, line in enumerate(f, start=1):
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield n, None, f"not JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield n, record, None
+            else:
+                yield n, None, "not a JSON object."
+
+    finally:
+        if f is not sys.stdin: f.close()
+
+
+def read_tree(path:str) -> SloppyTree:
+    """
+    Read a SloppyTree written by write_tree. Returns None if the
+    file is missing or cannot be understood.
+    """
+    try:
+        with open(path) as f:
+            return tree_from_dict(json.load(f))
+    except (OSError, ValueError) as e:
+        return None
+
+
+def rewrite_in_place(path:str, text:str) -> bool:
+    """
+    Overwrite the contents of a file that we may write but not
+    replace. The new text goes in before the old tail is cut off, so
+    there is no moment at which the file is empty.
+    """
+    try:
+        with open(path, 'r+') as f:
+            f.write(text)
+            f.truncate()
+        return True
+    except OSError as e:
+        return False
+
+
+def run_result(code:int, stdout:str, stderr:str, return_datatype:type) -> object:
+    """
+    What dorunrun and adorunrun return for each return_datatype.
+    """
+    if return_datatype is bool:
+        return code == 0
+    elif return_datatype is int:
+        return code
+    elif return_datatype is str:
+        return stdout
+    elif return_datatype is tuple:
+        return code, stdout, stderr
+    elif return_datatype is dict:
+        return {"code":code, "stdout":stdout, "stderr":stderr}
+    else:
+        raise Exception(f"Unknown: {return_datatype=}")
+
+
+def script_answers(f:BinaryIO=None, bufsize:int=1<<20) -> Tuple[int, str]:
+    """
+    A generator of the answers in a script, one per line, read in
+    large pieces rather than a line at a time. A regular file is
+    mapped into memory. Everything after the octothorpe is ignored,
+    and a line with EOF ends the script. A blank line is still an
+    answer -- it means "use the default" -- so it is not skipped.
+
+    yields -- (line number, the answer)
+    """
+    fd = (sys.stdin if f is None else f).fileno()
+
+    def pieces() -> bytes:
+        info = os.fstat(fd)
+        if stat.S_ISREG(info.st_mode) and info.st_size:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as m:
+                start = os.lseek(fd, 0, os.SEEK_CUR)
+                yield from ( m[i:i+bufsize] for i in range(start, info.st_size, bufsize) )
+        else:
+            while (piece := os.read(fd, bufsize)):
+                yield piece
+
+    def lines() -> bytes:
+        rest = b""
+        for piece in pieces():
+            parts = (rest + piece).split(b"\n")
+            rest = parts.pop()
+            yield from parts
+        # A last line without a newline is still a line.
+        if rest: yield rest
+
+    for n, line in enumerate(lines(), start=1):
+        answer = line.split(b"#", 1)[0].strip().decode('utf-8', errors='replace')
+        if answer == 'EOF': return
+        yield n, answer
+
+
 def script_driven() -> bool:
     """
     returns True if the input is piped or coming from an IO redirect.
@@ -345,6 +1087,30 @@ def script_driven() -> bool:
     return True if stat.S_ISFIFO(mode) or stat.S_ISREG(mode) else False
 
 
+def slurm_accounts(user:str, result:Union[tuple, Exception]=None) -> Set[str]:
+    """
+    The accounts that SLURM associates with user, or None if
+    sacctmgr is not here or will not say.
+
+    result -- what dorunrun(slurm_accounts_command(user), return_datatype=tuple)
+        returned or raised, if the caller has already run it.
+    """
+    try:
+        if result is None:
+            result = dorunrun(slurm_accounts_command(user), timeout=10, return_datatype=tuple)
+        if isinstance(result, Exception): raise result
+        code, out, err = result
+    except Exception as e:
+        return None
+
+    return set(_.strip() for _ in out.split('\n') if _.strip()) if code == 0 else None
+
+
+def slurm_accounts_command(user:str) -> List[str]:
+    return ['sacctmgr', '--noheader', '--parsable2', 'show', 'associations', 
+        f'user={user}', 'format=account']
+
+
 def time_check(s:str, return_str:bool=False) -> Union[str, bool]:
     """
     This function either checks or formats the time.
@@ -352,10 +1118,70 @@ def time_check(s:str, return_str:bool=False) -> Union[str, bool]:
     s -- some string thought to represent a time of day.
     return_str -- a flag, that when True returns the parsed and formatted time.
         If this flag is False, then we just check if the time is valid.
+
+    The check and the formatting of the same answer share one parse.
     """
+    t = parse_time(s)
     if return_str:
-        return datetime.datetime.isoformat(dateparser.parse(s))[:16]
+        return datetime.datetime.isoformat(t)[:16]
     else:
-        return True if dateparser.parse(s) else False
-    
+        return True if t else False
+
+
+def tree_from_dict(d:dict) -> SloppyTree:
+    """
+    Rebuild a SloppyTree, all the way down, from nested dicts.
+    """
+    t = SloppyTree()
+    for k, v in d.items():
+        t[k] = tree_from_dict(v) if isinstance(v, dict) else v
+    return t
+
+
+def write_tree(path:str, t:SloppyTree) -> bool:
+    """
+    Write t to path as JSON. The file is written beside its final
+    location and renamed into place, so readers never see half of it.
+    Returns True if the file was written.
+
+    In a shared (sticky) cache directory only a file's owner may
+    replace it, so everyone else rewrites the file in place. That
+    is safe only for a caller who holds the file's lock (cached_tree
+    and claim_refresh), and a reader who catches the file half
+    written cannot parse it, and so treats it as missing. Files in
+    a shared directory are made 0o666 so that anyone can do this.
+    """
+    try:
+        text = json.dumps(t)
+    except TypeError as e:
+        return False
 
+    shared = False
+    try:
+        shared = bool(os.stat(os.path.dirname(path) or '.').st_mode & stat.S_ISVTX)
+        fd, tempname = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tempname, 0o666 if shared else 0o644)
+        os.replace(tempname, path)
+        return True
+
+    except PermissionError as e:
+        try:
+            os.unlink(tempname)
+        except Exception as e:
+            pass
+        return shared and rewrite_in_place(path, text)
+
+    except OSError as e:
+        try:
+            os.unlink(tempname)
+        except Exception as e:
+            pass
+        return False
+
+
+###
+# Read the umask while this is the only thread (see current_umask).
+###
+current_umask()